@@ -3,8 +3,10 @@
 
 Based on: https://www.omnicalculator.com/sports/elo
 """
+import bisect
 import operator
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 
 def calculate_elo_rating(subject_elo_rating, agent_elo_rating, k_factor=20, score=1, number_of_decimals=1):
@@ -85,104 +87,182 @@ def get_ranking_from_elo_rating_dictionary(input_dict, subject_id):
     return [subject_tuple[0] for subject_tuple in sorted_subject_to_elo_rating].index(subject_id) + 1
 
 
-def iterate_elo_rating_calculation_for_dataframe(dataframe, winner_id_column, loser_id_column, tie_column=None, additional_columns=None):
+def calculate_elo_ratings_for_matches(winner_ids, loser_ids, is_tie=None, default_elo_rating=1000, **calculate_elo_rating_params):
+    """
+    Calculates the Elo rating and ranking of both subjects after every match, in order.
+    The IDs are converted to integers, and the ratings are kept in a list indexed by them.
+    The ranking is kept in a sorted list that is updated with bisect when a rating changes, instead of sorting all the subjects every match.
+    Subjects with the same rating are ranked in the order that they were first seen, the same as get_ranking_from_elo_rating_dictionary.
+
+    Args:
+        winner_ids(list, Numpy array or Pandas Series): ID of the winner of every match
+        loser_ids(list, Numpy array or Pandas Series): ID of the loser of every match
+        is_tie(list, Numpy array, Pandas Series or None): Whether or not every match was a tie. If None, there are no ties.
+        default_elo_rating(int): The Elo rating of a subject before its first match
+        **calculate_elo_rating_params(kwargs): Other params for the calculate_elo_rating to change how the Elo rating is calculated
+
+    Returns:
+        Dict: Of column names to Numpy arrays, with two rows per match. The winner's row and then the loser's row.
+            The columns are the same as the values from iterate_elo_rating_calculation_for_dataframe.
+    """
+    winner_ids = np.asarray(winner_ids, dtype=object)
+    loser_ids = np.asarray(loser_ids, dtype=object)
+    number_of_matches = len(winner_ids)
+    # Numbering the subjects in the order that they are first seen, with the winner of a match before the loser
+    subject_codes, subject_ids = pd.factorize(np.column_stack([winner_ids, loser_ids]).reshape(-1), use_na_sentinel=False)
+    winner_codes = subject_codes[0::2]
+    loser_codes = subject_codes[1::2]
+    if is_tie is None:
+        is_tie = np.zeros(number_of_matches, dtype=bool)
+    is_tie = np.asarray(is_tie, dtype=bool)
+
+    # Python floats are used inside of the loop, because indexing a Numpy array one element at a time is slow
+    current_elo_ratings = [float(default_elo_rating)] * len(subject_ids)
+    # Sorted list of (negative rating, subject code) of the subjects that have been seen, so the index is the rank minus one
+    ranking_keys = []
+    is_seen = [False] * len(subject_ids)
+
+    # Columns with the winner's rows at even indexes and the loser's rows at odd indexes, converted to Numpy arrays at the end
+    original_elo_ratings = [0.0] * (2 * number_of_matches)
+    updated_elo_ratings = [0.0] * (2 * number_of_matches)
+    win_draw_loss = [0.0] * (2 * number_of_matches)
+    subject_rankings = [0] * (2 * number_of_matches)
+    agent_rankings = [0] * (2 * number_of_matches)
+
+    for match_index, (winner_code, loser_code, match_is_tie) in enumerate(zip(winner_codes.tolist(), loser_codes.tolist(), is_tie.tolist())):
+        for subject_code in (winner_code, loser_code):
+            if not is_seen[subject_code]:
+                is_seen[subject_code] = True
+                bisect.insort(ranking_keys, (-current_elo_ratings[subject_code], subject_code))
+        winner_score, loser_score = (0.5, 0.5) if match_is_tie else (1, 0)
+
+        # Getting the current Elo rating
+        current_winner_rating = current_elo_ratings[winner_code]
+        current_loser_rating = current_elo_ratings[loser_code]
+        for subject_code in {winner_code, loser_code}:
+            del ranking_keys[bisect.bisect_left(ranking_keys, (-current_elo_ratings[subject_code], subject_code))]
+
+        # Calculating Elo rating the same way as update_elo_rating
+        current_elo_ratings[winner_code] = calculate_elo_rating(subject_elo_rating=current_winner_rating, \
+            agent_elo_rating=current_loser_rating, score=winner_score, **calculate_elo_rating_params)
+        current_elo_ratings[loser_code] = calculate_elo_rating(subject_elo_rating=current_loser_rating, \
+            agent_elo_rating=current_winner_rating, score=loser_score, **calculate_elo_rating_params)
+        for subject_code in {winner_code, loser_code}:
+            bisect.insort(ranking_keys, (-current_elo_ratings[subject_code], subject_code))
+        winner_ranking = bisect.bisect_left(ranking_keys, (-current_elo_ratings[winner_code], winner_code)) + 1
+        loser_ranking = bisect.bisect_left(ranking_keys, (-current_elo_ratings[loser_code], loser_code)) + 1
+
+        winner_index = 2 * match_index
+        loser_index = winner_index + 1
+        original_elo_ratings[winner_index] = current_winner_rating
+        original_elo_ratings[loser_index] = current_loser_rating
+        updated_elo_ratings[winner_index] = current_elo_ratings[winner_code]
+        updated_elo_ratings[loser_index] = current_elo_ratings[loser_code]
+        win_draw_loss[winner_index] = winner_score
+        win_draw_loss[loser_index] = loser_score
+        subject_rankings[winner_index] = agent_rankings[loser_index] = winner_ranking
+        subject_rankings[loser_index] = agent_rankings[winner_index] = loser_ranking
+
+    subject_ids = np.asarray(subject_ids, dtype=object)
+    return {
+        "total_match_number": np.repeat(np.arange(1, number_of_matches + 1), 2),
+        "subject_id": subject_ids[np.column_stack([winner_codes, loser_codes]).reshape(-1)],
+        "agent_id": subject_ids[np.column_stack([loser_codes, winner_codes]).reshape(-1)],
+        "original_elo_rating": np.array(original_elo_ratings, dtype=np.float64),
+        "updated_elo_rating": np.array(updated_elo_ratings, dtype=np.float64),
+        "win_draw_loss": np.array(win_draw_loss, dtype=np.float64),
+        "subject_ranking": np.array(subject_rankings, dtype=np.int64),
+        "agent_ranking": np.array(agent_rankings, dtype=np.int64),
+        "pairing_index": np.tile([0, 1], number_of_matches),
+    }
+
+def get_tie_flags(dataframe, tie_column=None):
+    """
+    Gets whether or not every row of a dataframe is a tie.
+    The tie column is converted to bool, so False, 0 and empty strings are not ties, and any other values (including NaNs) are ties.
+    If the column can't be converted to bool, only the values that are not missing and are True are ties.
+
+    Args:
+        dataframe(Pandas DataFrame): The dataframe of matches
+        tie_column(str): The name of the column that has whether or not the match was a tie. If None, there are no ties.
+
+    Returns:
+        Numpy array: Of bools for every row
+    """
+    if not tie_column or tie_column not in dataframe.columns:
+        return np.zeros(len(dataframe), dtype=bool)
+    try:
+        return dataframe[tie_column].astype(bool).to_numpy(dtype=bool)
+    except (TypeError, ValueError):
+        return np.array([not pd.isna(value) and bool(value) for value in dataframe[tie_column]], dtype=bool)
+
+def get_elo_rating_dataframe_from_columns(elo_rating_columns):
+    """
+    Converts the columns from calculate_elo_ratings_for_matches into a dataframe with small types.
+    The match numbers are int32, the IDs are categorical (with the subjects in the order they were first seen),
+    the ratings and scores are float32 and the rankings are int16.
+    Float32 keeps about 7 significant digits, so ratings like 1010.3 are not exactly the same as the rounded Python float.
+
+    Args:
+        elo_rating_columns(dict): Output of calculate_elo_ratings_for_matches, with any additional columns
+
+    Returns:
+        Pandas DataFrame: With one row per subject per match
+    """
+    subject_categories = pd.unique(pd.Series(elo_rating_columns["subject_id"], dtype=object).dropna())
+    elo_rating_dataframe = pd.DataFrame({
+        "total_match_number": elo_rating_columns["total_match_number"].astype(np.int32),
+        "subject_id": pd.Categorical(elo_rating_columns["subject_id"], categories=subject_categories),
+        "agent_id": pd.Categorical(elo_rating_columns["agent_id"], categories=subject_categories),
+        "original_elo_rating": elo_rating_columns["original_elo_rating"].astype(np.float32),
+        "updated_elo_rating": elo_rating_columns["updated_elo_rating"].astype(np.float32),
+        "win_draw_loss": elo_rating_columns["win_draw_loss"].astype(np.float32),
+        "subject_ranking": elo_rating_columns["subject_ranking"].astype(np.int16),
+        "agent_ranking": elo_rating_columns["agent_ranking"].astype(np.int16),
+        "pairing_index": elo_rating_columns["pairing_index"].astype(np.int8),
+    })
+    # Any additional columns keep the type of their values
+    for column, values in elo_rating_columns.items():
+        if column not in elo_rating_dataframe.columns:
+            elo_rating_dataframe[column] = pd.Series(values).infer_objects()
+    return elo_rating_dataframe
+
+def iterate_elo_rating_calculation_for_dataframe(dataframe, winner_id_column, loser_id_column, tie_column=None, additional_columns=None, \
+    return_dataframe=False):
     """
     Iterates through a dataframe that has the ID of winners and losers for a given event. 
     A dictionary will be created that contains the information of the event, 
     which can then be turned into a dataframe. Each key is either from winner or loser's perspective. 
+    The ratings and rankings are calculated with calculate_elo_ratings_for_matches.
 
     Args:
         dataframe(Pandas DataFrame): 
         winner_id_column(str): The name of the column that has the winner's ID
         loser_id_column(str): The name of the column that has the loser's ID
+        tie_column(str): The name of the column that has whether or not the match was a tie
         additional_columns(list): Additional columns to take from the 
+        return_dataframe(bool): Whether or not to return a dataframe from get_elo_rating_dataframe_from_columns instead of a dictionary.
+            This is much smaller for long histories, because there is no dictionary for every row.
 
     Returns:
         Dict: With a key value pair for each event either from the winner or loser's perspective. 
             This can be turned into a dataframe with each key value pair being a row.
+            Or a Pandas DataFrame of those rows if return_dataframe is True.
     """
     if additional_columns is None:
         additional_columns = []
 
-    # Dictionary that keeps track of the current Elo rating of the subject
-    id_to_elo_rating = defaultdict(lambda:1000)
-    # Dictionary that will be converted to a DataFrame
-    index_to_elo_rating_and_meta_data = defaultdict(dict)
-
-    # Indexes that will identify which row the dictionary key value pair will be
-    # The number of the index has no significance other than being the number of the row
-    all_indexes = iter(range(0, 99999))
+    # Only the rows that have a winner are matches
+    matches_dataframe = dataframe.dropna(subset=winner_id_column)
+    elo_rating_columns = calculate_elo_ratings_for_matches(winner_ids=matches_dataframe[winner_id_column].to_numpy(dtype=object), \
+        loser_ids=matches_dataframe[loser_id_column].to_numpy(dtype=object), is_tie=get_tie_flags(matches_dataframe, tie_column))
+    # The winner and loser rows both have the values of the additional columns of the match
+    for column in additional_columns:
+        elo_rating_columns[column] = np.repeat(matches_dataframe[column].to_numpy(dtype=object), 2)
+    if return_dataframe:
+        return get_elo_rating_dataframe_from_columns(elo_rating_columns)
 
-    # Keeping track of the number of matches
-    total_match_number = 1
-
-    # Making a copy in case there is an error with changing the type of the tie column
-    copied_dataframe = dataframe.copy()
-    # Changing the tie column type to bool
-    # So that we can filter out for booleans including False and 0
-    try:
-        copied_dataframe[tie_column] = copied_dataframe[tie_column].astype(bool)
-    except:
-        copied_dataframe = dataframe.copy()
-
-    for index, row in copied_dataframe.dropna(subset=winner_id_column).iterrows():
-        # Getting the ID of the winner subject
-        winner_id = row[winner_id_column]
-        # Getting the ID of the loser subject
-        loser_id = row[loser_id_column]
-
-        # Getting the current Elo Score
-        current_winner_rating = id_to_elo_rating[winner_id] 
-        current_loser_rating = id_to_elo_rating[loser_id] 
-
-        if tie_column:
-            # When there is nothing in the tie column
-            # Or when there is a false value indicating that it is not a tie
-            if pd.isna(copied_dataframe[tie_column][index]) or ~(copied_dataframe[tie_column][index]).any():
-                winner_score = 1
-                loser_score = 0
-            # When there is value in the tie column
-            else:
-                winner_score = 0.5
-                loser_score = 0.5
-        # When there is no tie column
-        else:
-            winner_score = 1
-            loser_score = 0
-
-        # Updating the dictionary with ID keys and Elo Score values
-        update_elo_rating(winner_id=winner_id, loser_id=loser_id, id_to_elo_rating=id_to_elo_rating, \
-            winner_score=winner_score, loser_score=loser_score)
-
-        # Saving all the data for the winner
-        winner_index = next(all_indexes)
-        index_to_elo_rating_and_meta_data[winner_index]["total_match_number"] = total_match_number
-        index_to_elo_rating_and_meta_data[winner_index]["subject_id"] = winner_id
-        index_to_elo_rating_and_meta_data[winner_index]["agent_id"] = loser_id
-        index_to_elo_rating_and_meta_data[winner_index]["original_elo_rating"] = current_winner_rating
-        index_to_elo_rating_and_meta_data[winner_index]["updated_elo_rating"] = id_to_elo_rating[winner_id]
-        index_to_elo_rating_and_meta_data[winner_index]["win_draw_loss"] = winner_score
-        index_to_elo_rating_and_meta_data[winner_index]["subject_ranking"] = get_ranking_from_elo_rating_dictionary(id_to_elo_rating, winner_id)
-        index_to_elo_rating_and_meta_data[winner_index]["agent_ranking"] = get_ranking_from_elo_rating_dictionary(id_to_elo_rating, loser_id)
-        index_to_elo_rating_and_meta_data[winner_index]["pairing_index"] = 0
-        for column in additional_columns:
-            index_to_elo_rating_and_meta_data[winner_index][column] = row[column]  
-
-        # Saving all the data for the loser
-        loser_index = next(all_indexes)
-        index_to_elo_rating_and_meta_data[loser_index]["total_match_number"] = total_match_number
-        index_to_elo_rating_and_meta_data[loser_index]["subject_id"] = loser_id
-        index_to_elo_rating_and_meta_data[loser_index]["agent_id"] = winner_id
-        index_to_elo_rating_and_meta_data[loser_index]["original_elo_rating"] = current_loser_rating
-        index_to_elo_rating_and_meta_data[loser_index]["updated_elo_rating"] = id_to_elo_rating[loser_id]
-        index_to_elo_rating_and_meta_data[loser_index]["win_draw_loss"] = loser_score
-        index_to_elo_rating_and_meta_data[loser_index]["subject_ranking"] = get_ranking_from_elo_rating_dictionary(id_to_elo_rating, loser_id)
-        index_to_elo_rating_and_meta_data[loser_index]["agent_ranking"] = get_ranking_from_elo_rating_dictionary(id_to_elo_rating, winner_id)
-        index_to_elo_rating_and_meta_data[loser_index]["pairing_index"] = 1        
-        for column in additional_columns:
-            index_to_elo_rating_and_meta_data[loser_index][column] = row[column]  
-
-        # Updating the match number
-        total_match_number += 1
-
-    return index_to_elo_rating_and_meta_data
\ No newline at end of file
+    # Converting the columns to a dictionary of rows
+    column_names = list(elo_rating_columns.keys())
+    all_rows = zip(*[elo_rating_columns[column].tolist() for column in column_names])
+    return {index: dict(zip(column_names, row)) for index, row in enumerate(all_rows)}
@@ -6,9 +6,12 @@ For more information on the MED-PC's programming language, Trans:
 - https://www.med-associates.com/wp-content/uploads/2017/01/DOC-003-R3.4-SOF-735-MED-PC-IV-PROGRAMMER%E2%80%99S-MANUAL.pdf
 """
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import traceback
 import pandas as pd 
 from medpc2excel.medpc_read import medpc_read
+from extract.parser import get_medpc_wide_dataframe, compact_medpc_wide_dataframe, concat_compact_medpc_data
 
 def get_first_key_from_dictionary(input_dictionary):
     """
@@ -47,7 +50,7 @@ def get_medpc_dataframe_from_medpc_read_output(medpc_read_dictionary_output):
     # Dataframe must use both the date and subject key with the inputted dictionary
     return date, subject, medpc_read_dictionary_output[date][subject]
 
-def get_medpc_dataframe_from_list_of_files(medpc_files, stop_with_error=False):
+def get_medpc_dataframe_from_list_of_files(medpc_files, stop_with_error=False, compact=False, time_multiplier=100):
     """
     Gets the dataframe from the output from medpc2excel.medpc_read that extracts data from a MED-PC file.
     This is done with multiple files from a list. And the date and the subject of the recording session is extracted as well.
@@ -59,8 +62,14 @@ def get_medpc_dataframe_from_list_of_files(medpc_files, stop_with_error=False):
         stop_with_error: bool
             - Flag to terminate the program when an error is raised.
             - Sometimes MED-PC files have incorrect formatting, so can be skipped over.
+        compact: bool
+            - To return the compact representation from extract.parser.compact_medpc_wide_dataframe instead,
+            with categorical session keys and the values of each array without NaN padding
+            - Every file is compacted as soon as it is read, so the NaN padded dataframe of all the files is never made
+        time_multiplier: int or None
+            - Only used with compact. The values are multiplied by this and stored as int32, or stored as float32 if None.
     Returns:
-        Pandas DataFrame
+        Pandas DataFrame (or dict if compact)
             - Combined MED-PC DataFrame for all the files with the corresponding date and subject.
     """
     # List to combine all the Data Frames at the end
@@ -74,6 +83,8 @@ def get_medpc_dataframe_from_list_of_files(medpc_files, stop_with_error=False):
             medpc_df["date"] = date
             medpc_df["subject"] = subject
             medpc_df["file_path"] = file_path
+            if compact:
+                medpc_df = compact_medpc_wide_dataframe(medpc_df, time_multiplier=time_multiplier)
             all_medpc_df.append(medpc_df)
         except Exception: 
             # Printing out error messages and the corresponding traceback
@@ -84,8 +95,133 @@ def get_medpc_dataframe_from_list_of_files(medpc_files, stop_with_error=False):
             else:
                 # Continuing with execution
                 print("Invalid Formatting for file: {}".format(file_path))
+    if compact:
+        return concat_compact_medpc_data(all_medpc_df, time_multiplier=time_multiplier)
     return pd.concat(all_medpc_df)
 
+def get_medpc_dataframe_from_file(file_path, use_medpc2excel=False):
+    """
+    Gets the dataframe of a single MED-PC file, with the date, subject and file path added as columns.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC recording file.
+        use_medpc2excel: bool
+            - To read the file with medpc2excel.medpc_read instead of extract.parser
+    Returns:
+        Pandas DataFrame
+            - MED-PC DataFrame for the file with the corresponding date and subject.
+    """
+    if not use_medpc2excel:
+        return get_medpc_wide_dataframe(file_path)
+    # Reading in the MED-PC log file
+    ts_df, medpc_log = medpc_read(file=file_path, override=True, replace=False)
+    # Extracting the corresponding MED-PC Dataframe, date, and subject ID
+    date, subject, medpc_df = get_medpc_dataframe_from_medpc_read_output(medpc_read_dictionary_output=ts_df)
+    medpc_df["date"] = date
+    medpc_df["subject"] = subject
+    medpc_df["file_path"] = file_path
+    return medpc_df
+
+def get_medpc_dataframe_or_error_from_file(file_path, use_medpc2excel=False):
+    """
+    Runs get_medpc_dataframe_from_file, but returns the error instead of raising it.
+    This is used by the workers of get_medpc_dataframe_from_list_of_files_in_parallel.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC recording file.
+        use_medpc2excel: bool
+            - To read the file with medpc2excel.medpc_read instead of extract.parser
+    Returns:
+        Pandas DataFrame or None
+            - MED-PC DataFrame for the file, or None if there was an error
+        dict or None
+            - The file path, the type of the error, the error message and the traceback, or None if there was no error
+    """
+    try:
+        return get_medpc_dataframe_from_file(file_path, use_medpc2excel=use_medpc2excel), None
+    except Exception as e:
+        return None, {"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()}
+
+def get_compact_medpc_data_or_error_from_file(file_path, use_medpc2excel=False, time_multiplier=100):
+    """
+    Runs get_medpc_dataframe_or_error_from_file, and compacts the dataframe in the worker with extract.parser.compact_medpc_wide_dataframe.
+    So only the values without the NaN padding are sent back from the process.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC recording file.
+        use_medpc2excel: bool
+            - To read the file with medpc2excel.medpc_read instead of extract.parser
+        time_multiplier: int or None
+            - See extract.parser.compact_medpc_wide_dataframe
+    Returns:
+        dict or None
+            - The compact representation of the file, or None if there was an error
+        dict or None
+            - The file path, the type of the error, the error message and the traceback, or None if there was no error
+    """
+    try:
+        return compact_medpc_wide_dataframe(get_medpc_dataframe_from_file(file_path, use_medpc2excel=use_medpc2excel), \
+            time_multiplier=time_multiplier), None
+    except Exception as e:
+        return None, {"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()}
+
+def get_medpc_dataframe_from_list_of_files_in_parallel(medpc_files, max_workers=None, use_medpc2excel=False, chunksize=16, stop_with_error=False, \
+        compact=False, time_multiplier=100):
+    """
+    Parallel version of get_medpc_dataframe_from_list_of_files. The files are read by a pool of processes.
+    The dataframes are combined in the same order as the list of files, no matter which process finishes first.
+    Files that can not be read are put into an error table instead of being printed.
+
+    Args:
+        medpc_files: list
+            - List of MED-PC recording files. Can be either relative or absolute paths.
+        max_workers: int
+            - Number of processes. Defaults to the number of processors.
+        use_medpc2excel: bool
+            - To read the files with medpc2excel.medpc_read instead of extract.parser
+        chunksize: int
+            - Number of files sent to a process at a time. Larger chunks have less overhead for many small files.
+        stop_with_error: bool
+            - Flag to terminate the program when an error is raised.
+            - Sometimes MED-PC files have incorrect formatting, so can be skipped over.
+        compact: bool
+            - To return the compact representation from extract.parser.compact_medpc_wide_dataframe instead of the combined dataframe
+            - Every file is compacted by the process that reads it, so the NaN padded dataframe of all the files is never made
+        time_multiplier: int or None
+            - Only used with compact. See extract.parser.compact_medpc_wide_dataframe
+    Returns:
+        Pandas DataFrame (or dict if compact)
+            - Combined MED-PC DataFrame for all the files with the corresponding date and subject.
+        Pandas DataFrame
+            - Error table with the columns "file_path", "error_type", "error" and "traceback". One row for every file that could not be read.
+    """
+    all_medpc_df = []
+    all_errors = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        if compact:
+            results = executor.map(get_compact_medpc_data_or_error_from_file, medpc_files, \
+                itertools.repeat(use_medpc2excel), itertools.repeat(time_multiplier), chunksize=chunksize)
+        else:
+            results = executor.map(get_medpc_dataframe_or_error_from_file, medpc_files, itertools.repeat(use_medpc2excel), chunksize=chunksize)
+        for medpc_df, error in results:
+            if error is None:
+                all_medpc_df.append(medpc_df)
+            elif stop_with_error:
+                # Stopping the program all together
+                raise ValueError("Invalid Formatting for file: {}".format(error["file_path"]))
+            else:
+                all_errors.append(error)
+    error_df = pd.DataFrame(all_errors, columns=["file_path", "error_type", "error", "traceback"])
+    if compact:
+        return concat_compact_medpc_data(all_medpc_df, time_multiplier=time_multiplier), error_df
+    # Still returning the error table when none of the files could be read
+    if not all_medpc_df:
+        all_medpc_df = [pd.DataFrame(columns=["date", "subject", "file_path"])]
+    return pd.concat(all_medpc_df), error_df
+
 def main():
     """
     Main function that runs when the script is run
@@ -6,7 +6,36 @@ Metadata includes: "File", "Start Date", "End Date", "Subject", "Experiment", "G
 For more information on the MED-PC's programming language, Trans: 
 - https://www.med-associates.com/wp-content/uploads/2017/01/DOC-003-R3.4-SOF-735-MED-PC-IV-PROGRAMMER%E2%80%99S-MANUAL.pdf
 """
+import re
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import itertools
+import traceback
+import pandas as pd
+
+# The default metadata found in MED-PC files
+DEFAULT_META_DATA_HEADERS = ["File", "Start Date", "End Date", "Subject", "Experiment", "Group", "Box", "Start Time", "End Time", "MSN"]
+# The line that starts the first variable or array, i.e. "A:    4399.000" or "B:". The header is always before it.
+VARIABLE_LINE_PATTERN = re.compile(r"^[A-Z]:")
+
+def get_meta_data_pattern(meta_data_headers):
+    """
+    Creates one regular expression that matches a line of any of the metadata headers, i.e. "Start Date: 05/04/22".
+    The header is in the "header" group and the value is in the "value" group.
+
+    Args:
+        meta_data_headers: list
+            - List of the types of metadata to be parsed out for
+
+    Returns:
+        re.Pattern
+            - The compiled regular expression
+    """
+    # Longer headers first so that a header is never matched by another header that it starts with
+    headers = sorted(meta_data_headers, key=len, reverse=True)
+    return re.compile(r"^\s*(?P<header>{}):\s*(?P<value>.*?)\s*$".format("|".join(re.escape(header) for header in headers)))
+
+DEFAULT_META_DATA_PATTERN = get_meta_data_pattern(DEFAULT_META_DATA_HEADERS)
 
 def get_med_pc_meta_data(file_path, meta_data_headers=None, file_path_to_meta_data=None):
     """
@@ -113,6 +142,155 @@ def get_all_med_pc_meta_data_from_files(list_of_files, meta_data_headers=None, f
             print("Please review contents of {}".format(file_path))
     return file_path_to_meta_data
 
+def get_med_pc_meta_data_or_error(file_path, meta_data_headers=None):
+    """
+    Runs get_med_pc_meta_data for one file, but returns the error instead of raising it.
+    This is used by the workers of get_all_med_pc_meta_data_from_files_in_parallel.
+
+    Args:
+        file_path: str
+            - The path to the MED-PC data file 
+        meta_data_headers: list
+            - List of the types of metadata to be parsed out for
+
+    Returns:
+        dict or None:
+            - The meta data headers as the keys and the meta data as the values, or None if there was an error
+        dict or None:
+            - The file path, the type of the error, the error message and the traceback, or None if there was no error
+    """
+    try:
+        return get_med_pc_meta_data(file_path=file_path, meta_data_headers=meta_data_headers)[file_path], None
+    except Exception as e:
+        return None, {"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()}
+
+def get_all_med_pc_meta_data_from_files_in_parallel(list_of_files, meta_data_headers=None, file_path_to_meta_data=None, max_workers=None, chunksize=64):
+    """
+    Parallel version of get_all_med_pc_meta_data_from_files. The files are read by a pool of processes.
+    The dictionary is filled in the same order as the list of files, no matter which process finishes first.
+    Files that can not be read are put into an error table instead of being printed.
+
+    Args:
+        list_of_files: list
+            - A list of file paths(not names, must be relative or absolute path) of MED-PC output files
+        meta_data_headers: list
+            - List of the types of metadata to be parsed out for
+        file_path_to_meta_data: Nested Default Dictionary
+            - Any dictionary that has already been produced by this function that more metadata is chosen to be added to.
+        max_workers: int
+            - Number of processes. Defaults to the number of processors.
+        chunksize: int
+            - Number of files sent to a process at a time. Larger chunks have less overhead for many small files.
+    
+    Returns:
+        Nested Default Dictionary:
+            - With the file path as the key, and the meta data headers as the values. 
+            And then the meta data headers are the nested keys, and the meta data as the values.
+        Pandas DataFrame:
+            - Error table with the columns "file_path", "error_type", "error" and "traceback". One row for every file that could not be read.
+    """
+    # Creating a new dictionary if none is inputted
+    if file_path_to_meta_data is None:
+        file_path_to_meta_data = defaultdict(dict)
+
+    all_errors = []
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, (meta_data, error) in zip(list_of_files, executor.map(get_med_pc_meta_data_or_error, list_of_files, \
+                itertools.repeat(meta_data_headers), chunksize=chunksize)):
+            if error is None:
+                file_path_to_meta_data[file_path].update(meta_data)
+            else:
+                all_errors.append(error)
+    return file_path_to_meta_data, pd.DataFrame(all_errors, columns=["file_path", "error_type", "error", "traceback"])
+
+def read_med_pc_meta_data_header(file_path, meta_data_headers=None):
+    """
+    Parses out the metadata from the header of a MED-PC data file. 
+    Unlike get_med_pc_meta_data, the file is read one line at a time and reading stops at the first variable or array.
+    So only the header block is read no matter how large the file is.
+
+    Args:
+        file_path: str
+            - The path to the MED-PC data file 
+        meta_data_headers: list
+            - List of the types of metadata to be parsed out for
+            - Default metadata includes: "File", "Start Date", "End Date", "Subject", "Experiment", "Group", "Box", "Start Time", "End Time", "MSN"
+
+    Returns:
+        dict:
+            - The meta data headers as the keys and the meta data as the values
+    """
+    if meta_data_headers is None:
+        meta_data_headers = DEFAULT_META_DATA_HEADERS
+        meta_data_pattern = DEFAULT_META_DATA_PATTERN
+    else:
+        meta_data_pattern = get_meta_data_pattern(meta_data_headers)
+
+    meta_data = {}
+    with open(file_path, "r", errors="replace") as file:
+        for line in file:
+            # The header block ends at the first variable or array
+            if VARIABLE_LINE_PATTERN.match(line):
+                break
+            match = meta_data_pattern.match(line)
+            if match is not None:
+                meta_data.setdefault(match["header"], match["value"])
+                # Stopping once all the headers are found
+                if len(meta_data) == len(meta_data_headers):
+                    break
+    return meta_data
+
+def get_meta_data_or_error(file_path, meta_data_headers=None):
+    """
+    Runs read_med_pc_meta_data_header, but returns the error instead of raising it.
+    This is used by the workers of scan_med_pc_meta_data.
+    """
+    try:
+        return read_med_pc_meta_data_header(file_path, meta_data_headers=meta_data_headers), None
+    except Exception as e:
+        return None, {"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()}
+
+def scan_med_pc_meta_data(list_of_files, max_workers=8):
+    """
+    Reads the header of many MED-PC files with a pool of threads, and combines the metadata into a typed dataframe.
+    Only the header block of each file is read, with read_med_pc_meta_data_header.
+
+    Args:
+        list_of_files: list
+            - A list of file paths(not names, must be relative or absolute path) of MED-PC output files
+        max_workers: int
+            - Number of threads. Reading the header is mostly waiting for the disk, so more threads than processors can help.
+
+    Returns:
+        Pandas DataFrame:
+            - One row per file, in the same order as the list of files, with the columns:
+                - "file_path": The path from the list of files
+                - "file": The "File" header, which is the path that MED-PC saved the file to
+                - "start_datetime" and "end_datetime": The "Start Date" and "End Date" combined with the "Start Time" and "End Time"
+                - "subject", "experiment", "group" and "msn": Categoricals of those headers
+                - "box": The box number as a nullable integer
+            - Missing or invalid values are NaN or NaT
+        Pandas DataFrame:
+            - Error table with the columns "file_path", "error_type", "error" and "traceback". One row for every file that could not be read.
+    """
+    all_meta_data = []
+    all_errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, (meta_data, error) in zip(list_of_files, executor.map(get_meta_data_or_error, list_of_files)):
+            if error is None:
+                all_meta_data.append(dict(meta_data, file_path=file_path))
+            else:
+                all_errors.append(error)
+
+    raw_df = pd.DataFrame(all_meta_data, columns=["file_path"] + DEFAULT_META_DATA_HEADERS)
+    meta_data_df = pd.DataFrame({"file_path": raw_df["file_path"], "file": raw_df["File"]})
+    meta_data_df["start_datetime"] = pd.to_datetime(raw_df["Start Date"] + " " + raw_df["Start Time"], format="%m/%d/%y %H:%M:%S", errors="coerce")
+    meta_data_df["end_datetime"] = pd.to_datetime(raw_df["End Date"] + " " + raw_df["End Time"], format="%m/%d/%y %H:%M:%S", errors="coerce")
+    for header in ["Subject", "Experiment", "Group", "MSN"]:
+        meta_data_df[header.lower()] = raw_df[header].astype("category")
+    meta_data_df["box"] = pd.to_numeric(raw_df["Box"], errors="coerce").astype("Int64")
+    return meta_data_df, pd.DataFrame(all_errors, columns=["file_path", "error_type", "error", "traceback"])
+
 def main():
     """
     Main function that runs when the script is run
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Functions for parsing MED-PC output data files without medpc2excel.
+
+Each file is tokenized with one regular expression pass, and the values of each array are converted to NumPy in one call.
+The array names are made the same way as medpc2excel, with the letter and the first two words of the comment
+on the DIM line of the MSN's .MPC file (i.e. "DIM S = 2500 \\CS presentation values" becomes "(S)CSpresentation").
+
+For more information on the MED-PC's programming language, Trans:
+- https://www.med-associates.com/wp-content/uploads/2017/01/DOC-003-R3.4-SOF-735-MED-PC-IV-PROGRAMMER%E2%80%99S-MANUAL.pdf
+"""
+import os
+import re
+import datetime
+import traceback
+import numpy as np
+import pandas as pd
+
+# Every kind of line in a MED-PC data file. The order matters, because a header like "File: ..." would also match a scalar.
+MEDPC_LINE_PATTERN = re.compile(r"""
+    ^(?:
+        (?P<scalar>[A-Z]):[ \t]+(?P<scalar_value>-?\d+(?:\.\d*)?)          # A:    4399.000
+      | (?P<array>[A-Z]):                                                   # B:
+      | [ \t]+\d+:(?P<row_values>(?:[ \t]+-?\d+(?:\.\d*)?)+)                #      0:       59.000       12.000
+      | (?P<header>[A-Za-z][A-Za-z ]*?):[ \t](?P<header_value>.*?)          # Start Date: 05/26/23
+    )[ \t]*\r?$
+    """, re.MULTILINE | re.VERBOSE)
+# DIM lines of a .MPC file with a comment, i.e. "DIM P = 20000 \Port entry time stamp array"
+MPC_DIM_PATTERN = re.compile(r"^[ \t]*DIM[ \t]+(?P<letter>[A-Z])[ \t]*=[ \t]*\d+[ \t]*\\(?P<comment>.*?)[ \t]*\r?$", re.MULTILINE)
+
+def get_array_names_from_mpc_file(mpc_file_path):
+    """
+    Gets the names of the arrays from the DIM lines of a MED-PC program (.MPC) file.
+    Only arrays with a comment get a name. The name is the letter in brackets and the first two words of the comment.
+
+    Args:
+        mpc_file_path: str
+            - Path to the .MPC file
+
+    Returns:
+        dict
+            - The array letter to the name, in the order of the DIM lines. i.e. {"P": "(P)Portentry", "S": "(S)CSpresentation"}
+    """
+    with open(mpc_file_path, "r", errors="replace") as file:
+        mpc_text = file.read()
+    return {match["letter"]: "({}){}".format(match["letter"], "".join(match["comment"].split()[:2])) \
+        for match in MPC_DIM_PATTERN.finditer(mpc_text)}
+
+def find_mpc_file(file_path, msn):
+    """
+    Finds the .MPC file of the program that created a MED-PC data file. It is expected to be in the same directory, named after the MSN.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+        msn: str
+            - The MSN of the data file, which is the name of the program
+
+    Returns:
+        str or None
+            - The path to the .MPC file, or None if it doesn't exist
+    """
+    dir_path = os.path.dirname(file_path) or "."
+    lower_mpc_file_name = "{}.mpc".format(msn).lower()
+    for file_name in os.listdir(dir_path):
+        if file_name.lower() == lower_mpc_file_name:
+            return os.path.join(dir_path, file_name)
+    return None
+
+def read_medpc_file(file_path, array_names=None):
+    """
+    Reads the metadata headers, scalar variables and arrays of a MED-PC data file.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+        array_names: dict
+            - The array letter to the name to use. Only the arrays in the dictionary are kept.
+            - Defaults to the names from the .MPC file of the MSN in the same directory, or all the arrays named by letter if there isn't one.
+
+    Returns:
+        dict
+            - "meta_data": The header names to the values. i.e. {"Subject": "1.1", "MSN": "CD1_reward_training"}
+            - "scalars": The letter to the value of the variables that are not arrays
+            - "arrays": The array name to a 1D Numpy array of the values, in the order of `array_names`
+    """
+    with open(file_path, "r", errors="replace") as file:
+        medpc_text = file.read()
+
+    meta_data = {}
+    scalars = {}
+    # The letter of each array to the text of its rows, which are converted all at once at the end
+    letter_to_rows = {}
+    current_rows = None
+    for match in MEDPC_LINE_PATTERN.finditer(medpc_text):
+        if match["row_values"] is not None:
+            if current_rows is not None:
+                current_rows.append(match["row_values"])
+        elif match["array"] is not None:
+            current_rows = letter_to_rows.setdefault(match["array"], [])
+        elif match["scalar"] is not None:
+            scalars[match["scalar"]] = float(match["scalar_value"])
+            current_rows = None
+        else:
+            meta_data[match["header"].strip()] = match["header_value"].strip()
+            current_rows = None
+
+    if array_names is None:
+        mpc_file_path = find_mpc_file(file_path, meta_data["MSN"]) if "MSN" in meta_data else None
+        if mpc_file_path is not None:
+            array_names = get_array_names_from_mpc_file(mpc_file_path)
+        else:
+            array_names = {letter: "({})".format(letter) for letter in sorted(letter_to_rows)}
+
+    arrays = {name: np.array(" ".join(letter_to_rows[letter]).split(), dtype=np.float64) \
+        for letter, name in array_names.items() if letter in letter_to_rows}
+    return {"meta_data": meta_data, "scalars": scalars, "arrays": arrays}
+
+def get_date_key(start_date):
+    """
+    Converts the "Start Date" of a MED-PC file (i.e. "05/26/23") to the date key used by medpc2excel (i.e. "20230526").
+
+    Args:
+        start_date: str
+            - The start date in the month/day/year format
+
+    Returns:
+        str
+            - The date in the year month day format
+    """
+    return datetime.datetime.strptime(start_date, "%m/%d/%y").strftime("%Y%m%d")
+
+def get_medpc_long_dataframe(file_path, array_names=None):
+    """
+    Reads a MED-PC data file into a long format dataframe, with one row per value of every array.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+        array_names: dict
+            - The array letter to the name to use. See `read_medpc_file`.
+
+    Returns:
+        Pandas DataFrame
+            - With the columns "date", "subject", "file_path", "array", "index" and "value"
+    """
+    medpc_file = read_medpc_file(file_path, array_names=array_names)
+    arrays = medpc_file["arrays"]
+    array_lengths = [len(values) for values in arrays.values()]
+    total_length = sum(array_lengths)
+    return pd.DataFrame({
+        "date": get_date_key(medpc_file["meta_data"]["Start Date"]),
+        "subject": medpc_file["meta_data"].get("Subject"),
+        "file_path": file_path,
+        "array": np.repeat(list(arrays), array_lengths) if arrays else np.array([], dtype=object),
+        "index": np.concatenate([np.arange(length, dtype=np.int32) for length in array_lengths]) if arrays else np.array([], dtype=np.int32),
+        "value": np.concatenate(list(arrays.values())) if arrays else np.array([], dtype=np.float64),
+    }, index=pd.RangeIndex(total_length))
+
+def get_medpc_wide_dataframe(file_path, array_names=None):
+    """
+    Reads a MED-PC data file into the same wide format as `extract.dataframe.get_medpc_dataframe_from_list_of_files`.
+    There is one column per array, padded with NaNs to the longest array, and then the date, subject and file path.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+        array_names: dict
+            - The array letter to the name to use. See `read_medpc_file`.
+
+    Returns:
+        Pandas DataFrame
+            - One row per index of the arrays
+    """
+    medpc_file = read_medpc_file(file_path, array_names=array_names)
+    medpc_df = pd.DataFrame({name: pd.Series(values) for name, values in medpc_file["arrays"].items()})
+    medpc_df["date"] = get_date_key(medpc_file["meta_data"]["Start Date"])
+    medpc_df["subject"] = medpc_file["meta_data"].get("Subject")
+    medpc_df["file_path"] = file_path
+    return medpc_df
+
+def get_medpc_long_dataframe_from_list_of_files(medpc_files, array_names=None, stop_with_error=False):
+    """
+    Reads multiple MED-PC data files into one long format dataframe, with one row per value of every array.
+
+    Args:
+        medpc_files: list
+            - List of MED-PC recording files. Can be either relative or absolute paths.
+        array_names: dict
+            - The array letter to the name to use. See `read_medpc_file`.
+        stop_with_error: bool
+            - Flag to terminate the program when an error is raised.
+            - Sometimes MED-PC files have incorrect formatting, so can be skipped over.
+    Returns:
+        Pandas DataFrame
+            - With the columns "date", "subject", "file_path", "array", "index" and "value"
+    """
+    all_medpc_df = []
+    for file_path in medpc_files:
+        try:
+            all_medpc_df.append(get_medpc_long_dataframe(file_path, array_names=array_names))
+        except Exception:
+            # Printing out error messages and the corresponding traceback
+            print(traceback.format_exc())
+            if stop_with_error:
+                # Stopping the program all together
+                raise ValueError("Invalid Formatting for file: {}".format(file_path))
+            else:
+                # Continuing with execution
+                print("Invalid Formatting for file: {}".format(file_path))
+    return pd.concat(all_medpc_df, ignore_index=True)
+
+def pivot_medpc_long_dataframe(medpc_long_df):
+    """
+    Converts the long format dataframe into the same wide format as `extract.dataframe.get_medpc_dataframe_from_list_of_files`.
+    There is one column per array, padded with NaNs to the longest array of the file, and then the date, subject and file path.
+
+    Args:
+        medpc_long_df: Pandas DataFrame
+            - Output of `get_medpc_long_dataframe` or `get_medpc_long_dataframe_from_list_of_files`
+
+    Returns:
+        Pandas DataFrame
+            - One row per index of each file, with the index starting at 0 for every file
+    """
+    # Keeping the order that the arrays and files first appear in
+    array_order = pd.unique(medpc_long_df["array"])
+    file_order = pd.unique(medpc_long_df["file_path"])
+    wide_df = medpc_long_df.pivot(index=["file_path", "index"], columns="array", values="value")
+    wide_df = wide_df.reindex(columns=array_order).reindex(file_order, level="file_path")
+    wide_df.columns.name = None
+
+    meta_data_df = medpc_long_df.drop_duplicates("file_path").set_index("file_path")[["date", "subject"]]
+    wide_df = wide_df.reset_index(level="file_path")
+    wide_df["date"] = meta_data_df.loc[wide_df["file_path"], "date"].values
+    wide_df["subject"] = meta_data_df.loc[wide_df["file_path"], "subject"].values
+    wide_df = wide_df[list(array_order) + ["date", "subject", "file_path"]]
+    wide_df.index.name = None
+    return wide_df
+
+def compact_medpc_wide_dataframe(medpc_df, time_multiplier=100, key_columns=("date", "subject", "file_path")):
+    """
+    Converts the wide format dataframe into a compact representation, which takes much less memory for many files.
+    There is one row per file in a sessions dataframe, with categorical keys, instead of the keys being repeated on every row.
+    And the values of each array are stored without the NaN padding, in one flat array with the offsets of each session (a ragged layout).
+    The values of session `i` of an array are `values[offsets[i]:offsets[i + 1]]`.
+
+    Args:
+        medpc_df: Pandas DataFrame
+            - Output of `get_medpc_wide_dataframe`, `pivot_medpc_long_dataframe` or `extract.dataframe.get_medpc_dataframe_from_list_of_files`
+        time_multiplier: int or None
+            - The values are multiplied by this and stored as int32. MED-PC times are in 0.01 second resolution, so the default of 100 is exact.
+            - If None, the values are stored as float32 without scaling.
+        key_columns: tuple
+            - The columns that identify a session. Every other column is treated as an array.
+
+    Returns:
+        dict
+            - "sessions": Pandas DataFrame with one row per file, in the order they first appear, with the key columns as categoricals
+            - "arrays": The array name to a dict with "values" (int32 or float32) and "offsets" (int64, with one more than the number of sessions)
+            - "time_multiplier": The time multiplier, to convert the values back with `values / time_multiplier`
+
+    Raises:
+        ValueError: If a value times the time multiplier is not a whole number that fits in an int32
+    """
+    key_columns = [column for column in key_columns if column in medpc_df.columns]
+    array_columns = [column for column in medpc_df.columns if column not in key_columns]
+    session_codes, session_file_paths = pd.factorize(medpc_df["file_path"])
+    num_sessions = len(session_file_paths)
+
+    # The first row of every session has its keys
+    first_rows = np.unique(session_codes, return_index=True)[1]
+    sessions = medpc_df.iloc[first_rows][key_columns].reset_index(drop=True)
+    for column in key_columns:
+        sessions[column] = sessions[column].astype("category")
+
+    # Sorting the rows by session, keeping the order of the rows within each session
+    row_order = np.argsort(session_codes, kind="stable")
+    session_codes = session_codes[row_order]
+    arrays = {}
+    for column in array_columns:
+        values = medpc_df[column].to_numpy(dtype=np.float64)[row_order]
+        is_value = ~np.isnan(values)
+        values = values[is_value]
+        offsets = np.zeros(num_sessions + 1, dtype=np.int64)
+        np.cumsum(np.bincount(session_codes[is_value], minlength=num_sessions), out=offsets[1:])
+
+        if time_multiplier is None:
+            values = values.astype(np.float32)
+        else:
+            scaled_values = np.round(values * time_multiplier)
+            if not np.allclose(scaled_values, values * time_multiplier, rtol=0, atol=1e-6) or \
+                    (len(scaled_values) and np.abs(scaled_values).max() > np.iinfo(np.int32).max):
+                raise ValueError("The values of {} can not be stored as int32 with a time multiplier of {}".format(column, time_multiplier))
+            values = scaled_values.astype(np.int32)
+        arrays[column] = {"values": values, "offsets": offsets}
+    return {"sessions": sessions, "arrays": arrays, "time_multiplier": time_multiplier}
+
+def concat_compact_medpc_data(all_compact_medpc_data, time_multiplier=100):
+    """
+    Combines the compact representations of many files (or groups of files) into one, in the same order.
+    This is used to compact every file as soon as it is read, so that the NaN padded dataframe of all the files is never made.
+    The values of each array are joined together, and the offsets of each part are moved past the values of the parts before it.
+
+    Args:
+        all_compact_medpc_data: list
+            - Outputs of `compact_medpc_wide_dataframe`, which must all have the same time multiplier
+        time_multiplier: int or None
+            - The time multiplier of the parts. Only used for the output when the list is empty.
+
+    Returns:
+        dict
+            - The same as `compact_medpc_wide_dataframe`, with the sessions of all the parts.
+            Arrays that are missing from a part have no values for its sessions.
+
+    Raises:
+        ValueError: If the parts have different time multipliers
+    """
+    if not all_compact_medpc_data:
+        return compact_medpc_wide_dataframe(pd.DataFrame(columns=["date", "subject", "file_path"]), time_multiplier=time_multiplier)
+    time_multipliers = {compact_medpc_data["time_multiplier"] for compact_medpc_data in all_compact_medpc_data}
+    if len(time_multipliers) != 1:
+        raise ValueError("The parts must have the same time multiplier, but have {}".format(sorted(time_multipliers, key=str)))
+    time_multiplier = time_multipliers.pop()
+    values_dtype = np.float32 if time_multiplier is None else np.int32
+
+    sessions = pd.concat([compact_medpc_data["sessions"] for compact_medpc_data in all_compact_medpc_data], ignore_index=True)
+    # The categories of each part are different, so the combined keys are made categorical again
+    for column in sessions.columns:
+        sessions[column] = sessions[column].astype("category")
+
+    # Every array of any part, in the order they first appear
+    array_names = list(dict.fromkeys(array_name for compact_medpc_data in all_compact_medpc_data for array_name in compact_medpc_data["arrays"]))
+    arrays = {}
+    for array_name in array_names:
+        all_values = []
+        all_offsets = [np.zeros(1, dtype=np.int64)]
+        num_values = 0
+        for compact_medpc_data in all_compact_medpc_data:
+            num_sessions = len(compact_medpc_data["sessions"])
+            array = compact_medpc_data["arrays"].get(array_name, \
+                {"values": np.zeros(0, dtype=values_dtype), "offsets": np.zeros(num_sessions + 1, dtype=np.int64)})
+            all_values.append(array["values"])
+            # Skipping the first offset of each part, which is the last offset of the part before it
+            all_offsets.append(array["offsets"][1:] + num_values)
+            num_values += len(array["values"])
+        arrays[array_name] = {"values": np.concatenate(all_values).astype(values_dtype, copy=False), "offsets": np.concatenate(all_offsets)}
+    return {"sessions": sessions, "arrays": arrays, "time_multiplier": time_multiplier}
+
+def get_compact_medpc_session_values(compact_medpc_data, array_name, session_index):
+    """
+    Gets the values of an array for one session of the compact representation, converted back to float64.
+
+    Args:
+        compact_medpc_data: dict
+            - Output of `compact_medpc_wide_dataframe`
+        array_name: str
+            - Name of the array, i.e. "(P)Portentry"
+        session_index: int
+            - Row of the session in the sessions dataframe
+
+    Returns:
+        Numpy array
+            - The values of the array for the session, without any padding
+    """
+    array = compact_medpc_data["arrays"][array_name]
+    values = array["values"][array["offsets"][session_index]:array["offsets"][session_index + 1]].astype(np.float64)
+    if compact_medpc_data["time_multiplier"] is not None:
+        values /= compact_medpc_data["time_multiplier"]
+    return values
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+if __name__ == '__main__':
+    main()
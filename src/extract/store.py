@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Incremental ingestion of MED-PC data files into a Parquet store.
+
+A manifest keeps the size, modification time and hash of every file that has been ingested.
+Only files that are new or have changed are parsed, and each one is saved as its own Parquet file
+under hive style partition directories for its date and subject, i.e. "date=20230526/subject=1.1/".
+Loading the whole history is then a single columnar read of the store,
+and reads that filter on the date or subject only open the files in the matching directories.
+
+The Parquet files use the long format from extract.parser, so every file has the same columns no matter which arrays it has.
+The date and subject are only stored in the directory names, and are added back as columns when the store is read.
+Writing and reading the store requires pyarrow to be installed.
+"""
+import os
+import json
+import urllib.parse
+import hashlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from extract.parser import get_medpc_long_dataframe
+
+# Name of the manifest file in the store directory. Parquet readers skip files that start with "_"
+MANIFEST_FILE_NAME = "_manifest.json"
+# The columns that are stored in the directory names, in the order of the directories
+PARTITION_COLUMNS = ["date", "subject"]
+
+def get_file_hash(file_path, block_size=1024 * 1024):
+    """
+    Gets the SHA-1 hash of the contents of a file.
+
+    Args:
+        file_path: str
+            - Path to the file
+        block_size: int
+            - Number of bytes to read at a time
+
+    Returns:
+        str
+            - Hex digest of the contents
+    """
+    file_hash = hashlib.sha1()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+def read_manifest(store_dir):
+    """
+    Reads the manifest of a store.
+
+    Args:
+        store_dir: str
+            - Path to the store directory
+
+    Returns:
+        dict
+            - The absolute path of every ingested file to its "size", "mtime_ns", "hash" and "parquet_path" (relative to the store directory)
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as file:
+        return json.load(file)
+
+def write_manifest(store_dir, manifest):
+    """
+    Writes the manifest of a store. A temporary file is renamed over the old manifest, so an interrupted write keeps the old one.
+
+    Args:
+        store_dir: str
+            - Path to the store directory
+        manifest: dict
+            - Output of read_manifest, with any changes
+    """
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE_NAME)
+    temporary_path = manifest_path + ".tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(temporary_path, manifest_path)
+
+def get_partition_name(column, value):
+    """
+    Makes the hive style directory name of a date or subject, with the value URI encoded the same way that pyarrow decodes it.
+    i.e. ("subject", "4.4 (4)") becomes "subject=4.4%20%284%29", and ("subject", "1/2") becomes "subject=1%2F2"
+    """
+    return "{}={}".format(column, urllib.parse.quote(str(value), safe=""))
+
+def get_parquet_path(file_path, date, subject):
+    """
+    Gets the path of the Parquet file of a MED-PC data file, relative to the store directory.
+    i.e. "date=20230526/subject=1.1/{hash of the path}.parquet"
+    """
+    return os.path.join(get_partition_name("date", date), get_partition_name("subject", subject), \
+        "{}.parquet".format(hashlib.sha1(file_path.encode("utf-8")).hexdigest()))
+
+def get_partitioning():
+    """
+    Gets the pyarrow partitioning of the store, with the date and subject read as strings.
+    Otherwise pyarrow would guess that dates like "20230526" are integers and subjects like "1.1" are floats.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS]), flavor="hive")
+
+def get_medpc_long_dataframe_or_error(file_path):
+    """
+    Runs extract.parser.get_medpc_long_dataframe, but returns the error instead of raising it.
+    This is used by the workers of update_medpc_store.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+
+    Returns:
+        Pandas DataFrame or None
+            - Long format dataframe of the file, or None if there was an error
+        dict or None
+            - The file path, the type of the error, the error message and the traceback, or None if there was no error
+    """
+    try:
+        return get_medpc_long_dataframe(file_path), None
+    except Exception as e:
+        return None, {"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()}
+
+def update_medpc_store(medpc_files, store_dir, max_workers=None, chunksize=16):
+    """
+    Adds MED-PC data files to the store. Only the files that are new, or whose contents have changed since they were added, are parsed.
+    A file whose size and modification time are the same as in the manifest is assumed to be unchanged without hashing it.
+    Each parsed file replaces its previous Parquet file in the store at "{store_dir}/date={date}/subject={subject}/{hash of the path}.parquet".
+    Files that were saved by an older version of the store, without the hive style directories, are parsed and moved again.
+
+    Args:
+        medpc_files: list
+            - List of MED-PC recording files. Can be either relative or absolute paths.
+        store_dir: str
+            - Path to the store directory. It is created if it doesn't exist.
+        max_workers: int
+            - Number of processes for parsing. Defaults to the number of processors.
+        chunksize: int
+            - Number of files sent to a process at a time.
+
+    Returns:
+        list
+            - Absolute paths of the files that were parsed and saved
+        Pandas DataFrame
+            - Error table with the columns "file_path", "error_type", "error" and "traceback". One row for every file that could not be read.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    manifest = read_manifest(store_dir)
+
+    # Finding the files that are new or changed
+    files_to_parse = []
+    file_path_to_stat = {}
+    all_errors = []
+    for file_path in medpc_files:
+        absolute_file_path = os.path.abspath(file_path)
+        try:
+            file_stat = os.stat(absolute_file_path)
+            entry = manifest.get(absolute_file_path)
+            if entry is not None and not entry["parquet_path"].startswith(get_partition_name("date", "")):
+                # Saved without the hive style directories, so it is parsed again to move it
+                entry = dict(entry, hash=None)
+            elif entry is not None and entry["size"] == file_stat.st_size and entry["mtime_ns"] == file_stat.st_mtime_ns:
+                continue
+            file_hash = get_file_hash(absolute_file_path)
+        except Exception as e:
+            all_errors.append({"file_path": file_path, "error_type": type(e).__name__, "error": str(e), "traceback": traceback.format_exc()})
+            continue
+        if entry is not None and entry["hash"] == file_hash:
+            # Only the modification time changed, so there is nothing to parse
+            entry.update({"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns})
+            continue
+        file_path_to_stat[absolute_file_path] = {"size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns, "hash": file_hash}
+        files_to_parse.append(absolute_file_path)
+
+    saved_files = []
+    if files_to_parse:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for file_path, (medpc_long_df, error) in zip(files_to_parse, \
+                    executor.map(get_medpc_long_dataframe_or_error, files_to_parse, chunksize=chunksize)):
+                if error is not None:
+                    all_errors.append(error)
+                    continue
+                # Files without any array values still get saved, so that they are not parsed again
+                date = medpc_long_df["date"].iloc[0] if len(medpc_long_df) else "unknown"
+                subject = medpc_long_df["subject"].iloc[0] if len(medpc_long_df) else "unknown"
+                parquet_path = get_parquet_path(file_path, date, subject)
+                os.makedirs(os.path.dirname(os.path.join(store_dir, parquet_path)), exist_ok=True)
+                # The date and subject are in the directory names
+                medpc_long_df.drop(columns=PARTITION_COLUMNS).to_parquet(os.path.join(store_dir, parquet_path), index=False, engine="pyarrow")
+
+                # Removing the old Parquet file if the date or subject of the file changed
+                old_entry = manifest.get(file_path)
+                if old_entry is not None and old_entry["parquet_path"] != parquet_path:
+                    old_parquet_path = os.path.join(store_dir, old_entry["parquet_path"])
+                    if os.path.exists(old_parquet_path):
+                        os.remove(old_parquet_path)
+                    # Removing the subject and date directories of the old Parquet file if they are empty now
+                    for old_directory in [os.path.dirname(old_parquet_path), os.path.dirname(os.path.dirname(old_parquet_path))]:
+                        if os.path.isdir(old_directory) and not os.listdir(old_directory):
+                            os.rmdir(old_directory)
+                manifest[file_path] = dict(file_path_to_stat[file_path], parquet_path=parquet_path)
+                saved_files.append(file_path)
+
+    write_manifest(store_dir, manifest)
+    return saved_files, pd.DataFrame(all_errors, columns=["file_path", "error_type", "error", "traceback"])
+
+def read_medpc_store(store_dir, columns=None, filters=None):
+    """
+    Reads every file in the store into one long format dataframe.
+
+    Args:
+        store_dir: str
+            - Path to the store directory
+        columns: list
+            - Only read these columns. Defaults to all the columns.
+        filters: list
+            - Filters passed to pandas.read_parquet, i.e. [("subject", "==", "1.1")]
+            - Filters on "date" and "subject" only open the files in the matching partition directories. The values are strings.
+
+    Returns:
+        Pandas DataFrame
+            - With the columns "date", "subject", "file_path", "array", "index" and "value"
+    """
+    all_columns = ["date", "subject", "file_path", "array", "index", "value"]
+    if not read_manifest(store_dir):
+        return pd.DataFrame(columns=columns or all_columns)
+    medpc_long_df = pd.read_parquet(store_dir, engine="pyarrow", columns=columns, filters=filters, partitioning=get_partitioning())
+    # The partition columns are read after the columns of the files, so they are moved back to the front
+    return medpc_long_df[columns or all_columns]
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Functions for following MED-PC data files while they are being written during a session.
+
+Only the bytes added since the last read are parsed, one complete line at a time,
+so the work for every new line is the same no matter how large the file has become.
+Every new value of an array is emitted as an event, which can be used to update tone and port statistics during the session.
+"""
+import os
+import time
+from extract.parser import MEDPC_LINE_PATTERN, find_mpc_file, get_array_names_from_mpc_file
+
+class MedpcFileTail:
+    """
+    Follows one MED-PC data file, and parses the lines that have been added since the last read.
+    The file is read from the beginning again if it is replaced, which is found from its device and inode,
+    or from the first bytes of the file being different from what was read before (i.e. a file that is rewritten in place).
+    The events of the file are then emitted again from the first value, with a larger "generation".
+    So anything that is calculated from the events, i.e. live tone and port statistics, has to be cleared
+    when the generation of an event is different from the one before it. Otherwise the values before the rewrite are counted twice.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file. It does not need to exist yet.
+        array_names: dict
+            - The array letter to the name to use. See `extract.parser.read_medpc_file`.
+            - Defaults to the names from the .MPC file of the MSN, once the MSN header has been read. Arrays without a name are named by letter.
+
+    Attributes:
+        meta_data: dict
+            - The header names to the values that have been read so far
+        scalars: dict
+            - The letter to the latest value of the variables that are not arrays
+        array_lengths: dict
+            - The array name to the number of values that have been read so far
+        generation: int
+            - The number of times that the file was read from the beginning again, which is in every event. Starts at 0.
+    """
+    # Number of bytes at the start of the file that are compared to find out if the file was rewritten
+    HEAD_SIZE = 256
+
+    def __init__(self, file_path, array_names=None):
+        self.file_path = file_path
+        self.array_names = array_names
+        self.meta_data = {}
+        self.scalars = {}
+        self.array_lengths = {}
+        # The reset below starts the first generation at 0
+        self.generation = -1
+        self.reset()
+
+    def reset(self):
+        """
+        Starts reading the file from the beginning again. This is done automatically when the file is replaced or rewritten.
+        The generation is increased, so that the events that are read again can be told apart from the ones before.
+        """
+        self.generation += 1
+        self.offset = 0
+        # The device and inode of the file that was read, its modification time, and its first bytes
+        self.file_id = None
+        self.modified_time = None
+        self.head = b""
+        # Bytes at the end of the file after the last newline, which are parsed once the line is complete
+        self.partial_line = b""
+        self.current_array = None
+        self.meta_data.clear()
+        self.scalars.clear()
+        self.array_lengths.clear()
+
+    def get_array_name(self, letter):
+        """
+        Gets the name of an array from its letter, i.e. "P" to "(P)Portentry".
+        """
+        if self.array_names is None and "MSN" in self.meta_data:
+            mpc_file_path = find_mpc_file(self.file_path, self.meta_data["MSN"])
+            self.array_names = get_array_names_from_mpc_file(mpc_file_path) if mpc_file_path is not None else {}
+        if self.array_names:
+            return self.array_names.get(letter)
+        return "({})".format(letter)
+
+    def parse_line(self, line):
+        """
+        Parses one complete line of the file.
+
+        Args:
+            line: str
+                - The line without the newline
+
+        Returns:
+            list
+                - An event dict for every new array value on the line, with the keys "file_path", "subject", "generation", "array", "index" and "value"
+        """
+        match = MEDPC_LINE_PATTERN.match(line)
+        if match is None:
+            return []
+        if match["row_values"] is not None:
+            if self.current_array is None:
+                return []
+            events = []
+            index = self.array_lengths[self.current_array]
+            for value in match["row_values"].split():
+                events.append({"file_path": self.file_path, "subject": self.meta_data.get("Subject"), "generation": self.generation, \
+                    "array": self.current_array, "index": index, "value": float(value)})
+                index += 1
+            self.array_lengths[self.current_array] = index
+            return events
+        if match["array"] is not None:
+            # Arrays that are not named in the .MPC file are skipped, the same as in extract.parser
+            self.current_array = self.get_array_name(match["array"])
+            if self.current_array is not None:
+                self.array_lengths.setdefault(self.current_array, 0)
+        elif match["scalar"] is not None:
+            self.scalars[match["scalar"]] = float(match["scalar_value"])
+            self.current_array = None
+        else:
+            self.meta_data[match["header"].strip()] = match["header_value"].strip()
+            self.current_array = None
+        return []
+
+    def read_new_events(self):
+        """
+        Reads the bytes that have been added to the file since the last read, and parses the complete lines.
+
+        Returns:
+            list
+                - An event dict for every new array value. See `parse_line`.
+        """
+        try:
+            file_stat = os.stat(self.file_path)
+        except FileNotFoundError:
+            return []
+        file_id = (file_stat.st_dev, file_stat.st_ino)
+        if (self.file_id is not None and file_id != self.file_id) or file_stat.st_size < self.offset:
+            self.reset()
+        if file_stat.st_size == self.offset and file_stat.st_mtime_ns == self.modified_time:
+            return []
+
+        with open(self.file_path, "rb") as file:
+            # A file that was rewritten in place with the same size or larger has different first bytes
+            if self.head and file.read(len(self.head)) != self.head:
+                self.reset()
+            self.file_id = file_id
+            self.modified_time = file_stat.st_mtime_ns
+            file.seek(self.offset)
+            new_bytes = file.read(file_stat.st_size - self.offset)
+        self.offset += len(new_bytes)
+        if len(self.head) < self.HEAD_SIZE:
+            self.head += new_bytes[:self.HEAD_SIZE - len(self.head)]
+
+        lines = (self.partial_line + new_bytes).split(b"\n")
+        # The last piece is not a complete line yet
+        self.partial_line = lines.pop()
+        events = []
+        for line in lines:
+            events.extend(self.parse_line(line.decode("utf-8", errors="replace").rstrip("\r")))
+        return events
+
+def follow_medpc_file(file_path, array_names=None, poll_interval=0.5, idle_timeout=None):
+    """
+    Generator of the new array values of a MED-PC data file while it is being written.
+
+    Args:
+        file_path: str
+            - Path to the MED-PC data file
+        array_names: dict
+            - The array letter to the name to use. See `MedpcFileTail`.
+        poll_interval: float
+            - Number of seconds to wait before checking the file again when there is nothing new
+        idle_timeout: float or None
+            - Stop after this many seconds without anything new. Defaults to following the file forever.
+
+    Yields:
+        dict
+            - An event for every new array value, with the keys "file_path", "subject", "generation", "array", "index" and "value"
+            - The events of a file that was replaced are emitted again with a larger "generation", see `MedpcFileTail`
+    """
+    medpc_file_tail = MedpcFileTail(file_path, array_names=array_names)
+    last_event_time = time.monotonic()
+    while True:
+        events = medpc_file_tail.read_new_events()
+        if events:
+            last_event_time = time.monotonic()
+            yield from events
+            continue
+        if idle_timeout is not None and time.monotonic() - last_event_time >= idle_timeout:
+            return
+        time.sleep(poll_interval)
+
+def watch_medpc_files(file_paths, callback, array_names=None, poll_interval=0.5, idle_timeout=None):
+    """
+    Follows multiple MED-PC data files, i.e. one for every box, and calls a function with every new array value.
+
+    Args:
+        file_paths: list
+            - Paths to the MED-PC data files
+        callback: function
+            - Called with the event dict of every new array value. See `MedpcFileTail.parse_line`.
+            - A file that is replaced starts again with a larger "generation" in its events, and its earlier events should be dropped
+        array_names: dict
+            - The array letter to the name to use. See `MedpcFileTail`.
+        poll_interval: float
+            - Number of seconds to wait before checking the files again when there is nothing new
+        idle_timeout: float or None
+            - Stop after this many seconds without anything new in any file. Defaults to following the files forever.
+
+    Returns:
+        dict
+            - The file path to its `MedpcFileTail`, with the metadata, scalars and array lengths that were read
+    """
+    file_path_to_tail = {file_path: MedpcFileTail(file_path, array_names=array_names) for file_path in file_paths}
+    last_event_time = time.monotonic()
+    while True:
+        has_events = False
+        for medpc_file_tail in file_path_to_tail.values():
+            for event in medpc_file_tail.read_new_events():
+                has_events = True
+                callback(event)
+        if has_events:
+            last_event_time = time.monotonic()
+        elif idle_timeout is not None and time.monotonic() - last_event_time >= idle_timeout:
+            return file_path_to_tail
+        else:
+            time.sleep(poll_interval)
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+if __name__ == '__main__':
+    main()
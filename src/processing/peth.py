@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Functions for making peri-event time histograms (PETHs) of any kind of event around any kind of reference event.
+i.e. port entries around tones, spikes around port entries, or DIO edges around tones.
+
+The event times are sorted once, and the events in every bin of every trial are counted with numpy.searchsorted on the bin edges.
+So the work depends on the number of trials times the number of bins, and not on the number of events in each window.
+For many sessions, every session is searched on its own, so that the times of different sessions are never shifted or compared.
+"""
+import numpy as np
+import pandas as pd
+from processing.tone import get_sorted_valid_times
+
+def get_relative_bin_edges(pre_window, post_window, bin_size):
+    """
+    Gets the edges of the bins relative to the reference event.
+    i.e. A pre window of 2, a post window of 2, and a bin size of 1 gives [-2, -1, 0, 1, 2]
+
+    Args:
+        pre_window: float
+            - How long before the reference event to start, as a positive number
+        post_window: float
+            - How long after the reference event to stop
+        bin_size: float
+            - How long each bin is. The windows are rounded to a whole number of bins.
+    Returns:
+        Numpy array
+            - The edges of the bins, with one more than the number of bins
+    """
+    num_bins = int(round((pre_window + post_window) / bin_size))
+    if num_bins <= 0:
+        raise ValueError("The window from -{} to {} must have at least one bin of size {}".format(pre_window, post_window, bin_size))
+    return -pre_window + np.arange(num_bins + 1) * bin_size
+
+def get_peri_event_trial_counts(sorted_event_times, reference_times, bin_edges):
+    """
+    Counts the events in every bin around every reference event. Each bin includes its start and excludes its end.
+
+    Args:
+        sorted_event_times: Numpy array
+            - The sorted times of the events to count, without NaNs. i.e. from processing.tone.get_sorted_valid_times
+        reference_times: Numpy array
+            - The times of the events to align to, with one trial per reference event
+        bin_edges: Numpy array
+            - The edges of the bins relative to the reference event. i.e. from get_relative_bin_edges
+    Returns:
+        2D Numpy array
+            - The number of events in every bin of every trial. NaN for trials with a NaN reference time.
+    """
+    # The index of the first event at or after every bin edge of every trial, the difference is the count of each bin
+    event_indexes = np.searchsorted(sorted_event_times, reference_times[:, np.newaxis] + bin_edges[np.newaxis, :], side="left")
+    trial_counts = np.diff(event_indexes, axis=1).astype(np.float64)
+    trial_counts[np.isnan(reference_times)] = np.nan
+    return trial_counts
+
+def get_group_means_of_trial_counts(trial_counts, groups=None):
+    """
+    Averages the counts of the trials in each group, without the trials that don't have a reference time.
+
+    Args:
+        trial_counts: 2D Numpy array
+            - The count (or rate) of every bin of every trial, with a row of NaNs for trials without a reference time
+        groups: Pandas Series, Numpy array or None
+            - The group of every trial. If None, all the trials are in one group.
+    Returns:
+        Numpy array
+            - The name of every group, in the order they first appear
+        Numpy array
+            - The number of trials of every group that have a reference time
+        2D Numpy array
+            - The mean count (or rate) of the trials of every group for every bin
+    """
+    if groups is None:
+        group_codes = np.zeros(len(trial_counts), dtype=np.int64)
+        group_names = pd.Index(["all"])
+    else:
+        group_codes, group_names = pd.factorize(np.asarray(groups))
+    has_reference = ~np.isnan(trial_counts).any(axis=1)
+    # Summing the trials of each group, without the trials that don't have a reference time
+    group_sums = np.zeros((len(group_names), trial_counts.shape[1]))
+    np.add.at(group_sums, group_codes[has_reference], trial_counts[has_reference])
+    group_num_trials = np.bincount(group_codes[has_reference], minlength=len(group_names))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        group_means = group_sums / group_num_trials[:, np.newaxis]
+    return np.asarray(group_names), group_num_trials, group_means
+
+def get_peri_event_time_histogram(event_times, reference_times, pre_window, post_window, bin_size, groups=None, rate=False):
+    """
+    Counts the events in bins around every reference event, and averages the counts of the trials in each group.
+    Each bin includes its start and excludes its end.
+
+    Args:
+        event_times: Pandas Series or Numpy array
+            - The times of the events to count. i.e. port entries or spike times. Don't have to be sorted, and NaNs are skipped.
+        reference_times: Pandas Series or Numpy array
+            - The times of the events to align to, with one trial per reference event. i.e. tone times.
+        pre_window: float
+            - How long before the reference event to start, as a positive number. Must be in the same units as the times.
+        post_window: float
+            - How long after the reference event to stop
+        bin_size: float
+            - How long each bin is
+        groups: Pandas Series, Numpy array or None
+            - The group of every trial, with the same length as reference_times. i.e. the subject, or the trial type.
+            - If None, all the trials are in one group.
+        rate: bool
+            - Whether or not to divide the counts by the bin size, to get the number of events per unit of time
+    Returns:
+        dict
+            - "bin_edges": The edges of the bins relative to the reference event
+            - "bin_centers": The centers of the bins relative to the reference event
+            - "trial_counts": 2D Numpy array of the number of events in every bin of every trial. NaN for trials with a NaN reference time.
+            - "groups": The name of every group, in the order they first appear
+            - "group_num_trials": The number of trials of every group that have a reference time
+            - "group_means": 2D Numpy array of the mean count (or rate) of the trials of every group for every bin
+    """
+    bin_edges = get_relative_bin_edges(pre_window, post_window, bin_size)
+    trial_counts = get_peri_event_trial_counts(get_sorted_valid_times(event_times), np.asarray(reference_times, dtype=np.float64), bin_edges)
+    if rate:
+        trial_counts /= bin_size
+    group_names, group_num_trials, group_means = get_group_means_of_trial_counts(trial_counts, groups=groups)
+    return {"bin_edges": bin_edges, "bin_centers": (bin_edges[:-1] + bin_edges[1:]) / 2, "trial_counts": trial_counts, \
+        "groups": group_names, "group_num_trials": group_num_trials, "group_means": group_means}
+
+def get_peri_event_time_histogram_for_sessions(session_to_event_times, session_to_reference_times, pre_window, post_window, bin_size, \
+        session_to_groups=None, rate=False):
+    """
+    Makes a PETH for many sessions, where the events of each session are only counted around the reference events of that session.
+    The bin edges of every trial are searched in the sorted events of its own session, in the time base of that session,
+    so the counts of every trial are the same as from get_peri_event_time_histogram of its session alone.
+    Then the trials of all the sessions are averaged together by group.
+
+    Args:
+        session_to_event_times: dict
+            - The session (i.e. the file path) to the times of the events to count
+        session_to_reference_times: dict
+            - The session to the times of the events to align to. Sessions without event times have no events.
+        pre_window: float
+            - How long before the reference event to start, as a positive number
+        post_window: float
+            - How long after the reference event to stop
+        bin_size: float
+            - How long each bin is
+        session_to_groups: dict or None
+            - The session to the group of every trial of that session. If None, each session is its own group.
+        rate: bool
+            - Whether or not to divide the counts by the bin size
+    Returns:
+        dict
+            - The same as get_peri_event_time_histogram, with "trial_sessions" for the session of every trial
+    """
+    bin_edges = get_relative_bin_edges(pre_window, post_window, bin_size)
+    all_trial_counts = [np.zeros((0, len(bin_edges) - 1))]
+    all_groups = [np.zeros(0, dtype=object)]
+    all_trial_sessions = [np.zeros(0, dtype=object)]
+    for session, reference_times in session_to_reference_times.items():
+        reference_times = np.asarray(reference_times, dtype=np.float64)
+        event_times = get_sorted_valid_times(session_to_event_times.get(session, []))
+        all_trial_counts.append(get_peri_event_trial_counts(event_times, reference_times, bin_edges))
+        all_groups.append(np.full(len(reference_times), session, dtype=object) if session_to_groups is None \
+            else np.asarray(session_to_groups[session], dtype=object))
+        all_trial_sessions.append(np.full(len(reference_times), session, dtype=object))
+
+    trial_counts = np.concatenate(all_trial_counts)
+    if rate:
+        trial_counts /= bin_size
+    group_names, group_num_trials, group_means = get_group_means_of_trial_counts(trial_counts, groups=np.concatenate(all_groups))
+    return {"bin_edges": bin_edges, "bin_centers": (bin_edges[:-1] + bin_edges[1:]) / 2, "trial_counts": trial_counts, \
+        "groups": group_names, "group_num_trials": group_num_trials, "group_means": group_means, "trial_sessions": np.concatenate(all_trial_sessions)}
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+if __name__ == '__main__':
+    main()
@@ -74,6 +74,143 @@ def get_inside_port_mask(inside_port_numbers, max_time):
     inside_port_mask = np.isin(session_time_increments, inside_port_numbers)
     return session_time_increments, inside_port_mask
 
+def get_valid_port_entry_pairs(port_entry_scaled, port_exit_scaled):
+    """
+    Gets the port entry and port exit pairs where the entry is not after the exit. 
+    The other pairs don't have any increments in get_all_port_entry_increments, so they are skipped.
+
+    Args:
+        port_entry_scaled: Pandas Series or Numpy Array
+            - All the port entry times scaled (usually with the scale_time_to_whole_number function)
+        port_exit_scaled: Pandas Series or Numpy Array
+            - All the port exit times scaled (usually with the scale_time_to_whole_number function)
+    Returns: 
+        Numpy Array:
+            - The port entry times of the valid pairs as integers
+        Numpy Array:
+            - The port exit times of the valid pairs as integers
+    """
+    port_entry_scaled = np.asarray(port_entry_scaled).astype(np.int64)
+    port_exit_scaled = np.asarray(port_exit_scaled).astype(np.int64)
+    # Pairs are matched in order, the same as zip
+    num_pairs = min(len(port_entry_scaled), len(port_exit_scaled))
+    port_entry_scaled, port_exit_scaled = port_entry_scaled[:num_pairs], port_exit_scaled[:num_pairs]
+    is_valid = port_entry_scaled <= port_exit_scaled
+    return port_entry_scaled[is_valid], port_exit_scaled[is_valid]
+
+def get_port_occupancy_intervals(port_entry_scaled, port_exit_scaled, inclusive_stops=True):
+    """
+    Gets the durations that the subject is inside the port as sorted intervals that don't overlap.
+    This is a sparse version of get_all_port_entry_increments, with one start and stop for every time the subject is in the port. 
+    i.e. Port entries of [7136, 7140] and port exits of [7142, 7150] become the interval from 7136 to 7150
+
+    Args:
+        port_entry_scaled: Pandas Series or Numpy Array
+            - All the port entry times scaled (usually with the scale_time_to_whole_number function)
+        port_exit_scaled: Pandas Series or Numpy Array
+            - All the port exit times scaled (usually with the scale_time_to_whole_number function)
+        inclusive_stops: bool
+            - True for scaled whole number times, where the stop is the last increment inside the port, the same as get_all_port_entry_increments.
+            So an interval that starts at the increment right after the stop of another one is merged with it.
+            - False for times that are not scaled, i.e. seconds. The stop is where the interval ends, so intervals are only merged when they overlap or touch.
+            The times are not converted to whole numbers, and the pairs with a NaN are skipped.
+    Returns: 
+        Numpy Array:
+            - The start of every interval
+        Numpy Array:
+            - The stop of every interval
+    """
+    if inclusive_stops:
+        port_entry_scaled, port_exit_scaled = get_valid_port_entry_pairs(port_entry_scaled, port_exit_scaled)
+    else:
+        port_entry_scaled = np.asarray(port_entry_scaled, dtype=np.float64)
+        port_exit_scaled = np.asarray(port_exit_scaled, dtype=np.float64)
+        num_pairs = min(len(port_entry_scaled), len(port_exit_scaled))
+        port_entry_scaled, port_exit_scaled = port_entry_scaled[:num_pairs], port_exit_scaled[:num_pairs]
+        # Comparisons with NaN are False, so this also skips the NaN padding
+        is_valid = port_entry_scaled <= port_exit_scaled
+        port_entry_scaled, port_exit_scaled = port_entry_scaled[is_valid], port_exit_scaled[is_valid]
+    order = np.argsort(port_entry_scaled, kind="stable")
+    starts, stops = port_entry_scaled[order], port_exit_scaled[order]
+    if len(starts) == 0:
+        return starts, stops
+    # A new interval starts when the entry is after every increment (or every time) of the intervals before it
+    latest_stops = np.maximum.accumulate(stops)
+    is_new_interval = np.ones(len(starts), dtype=bool)
+    is_new_interval[1:] = starts[1:] > latest_stops[:-1] + (1 if inclusive_stops else 0)
+    interval_starts = np.flatnonzero(is_new_interval)
+    interval_stops = np.append(interval_starts[1:], len(starts)) - 1
+    return starts[interval_starts], latest_stops[interval_stops]
+
+def get_inside_port_mask_from_port_entries(port_entry_scaled, port_exit_scaled, max_time=None):
+    """
+    Gets a mask of all the times that the subject is inside the port, straight from the port entry and port exit times.
+    This is the same as get_inside_port_mask(get_all_port_entry_increments(port_entry_scaled, port_exit_scaled), max_time),
+    but every pair only adds one at the entry and removes one after the exit of a difference array. 
+    The cumulative sum of that is the number of pairs that the subject is inside at every time.
+    So no increments are created for the pairs.
+
+    Args:
+        port_entry_scaled: Pandas Series or Numpy Array
+            - All the port entry times scaled (usually with the scale_time_to_whole_number function)
+        port_exit_scaled: Pandas Series or Numpy Array
+            - All the port exit times scaled (usually with the scale_time_to_whole_number function)
+        max_time: int
+            - The number that represents the largest number for the time. See get_inside_port_mask
+            - Defaults to the last port exit
+    Returns: 
+        session_time_increments: Numpy Array
+            - Range of number from 1 to max time 
+        inside_port_mask: Numpy Array
+            - The mask of True or False if the subject is in the port during the time of that index
+    """
+    port_entry_scaled, port_exit_scaled = get_valid_port_entry_pairs(port_entry_scaled, port_exit_scaled)
+    if max_time is None:
+        max_time = port_exit_scaled.max()
+    inside_port_mask = get_inside_port_masks_for_sessions([port_entry_scaled], [port_exit_scaled], [max_time])[0]
+    return np.arange(1, max_time+1), inside_port_mask
+
+def get_inside_port_masks_for_sessions(all_port_entry_scaled, all_port_exit_scaled, all_max_time):
+    """
+    Gets the inside port mask of many sessions with one difference array. 
+    Each session gets its own part of the difference array, so there is one cumulative sum for all the sessions.
+
+    Args:
+        all_port_entry_scaled: list
+            - The scaled port entry times of every session
+        all_port_exit_scaled: list
+            - The scaled port exit times of every session
+        all_max_time: list
+            - The max time of every session. See get_inside_port_mask
+    Returns: 
+        list
+            - The inside port mask of every session, the same as the output of get_inside_port_mask for that session
+            - The index of the mask is one less than the time, because the mask starts at the time 1
+    """
+    all_max_time = np.maximum(np.asarray(all_max_time, dtype=np.int64), 0)
+    # Where each session starts in the combined mask
+    session_offsets = np.zeros(len(all_max_time) + 1, dtype=np.int64)
+    np.cumsum(all_max_time, out=session_offsets[1:])
+
+    all_starts = []
+    all_stops = []
+    for session_offset, max_time, port_entry_scaled, port_exit_scaled in \
+            zip(session_offsets, all_max_time, all_port_entry_scaled, all_port_exit_scaled):
+        port_entry_scaled, port_exit_scaled = get_valid_port_entry_pairs(port_entry_scaled, port_exit_scaled)
+        # Only the part of each pair between 1 and the max time is in the mask
+        starts = np.maximum(port_entry_scaled, 1)
+        stops = np.minimum(port_exit_scaled, max_time)
+        is_in_mask = starts <= stops
+        # Converting times to indexes of the combined mask
+        all_starts.append(starts[is_in_mask] - 1 + session_offset)
+        all_stops.append(stops[is_in_mask] + session_offset)
+
+    total_length = session_offsets[-1]
+    difference = np.bincount(np.concatenate(all_starts + [np.zeros(0, dtype=np.int64)]), minlength=total_length + 1).astype(np.int64)
+    difference -= np.bincount(np.concatenate(all_stops + [np.zeros(0, dtype=np.int64)]), minlength=total_length + 1)
+    inside_port_mask = np.cumsum(difference[:total_length]) > 0
+    return [inside_port_mask[start:stop] for start, stop in zip(session_offsets[:-1], session_offsets[1:])]
+
 def get_inside_port_probability_averages_for_all_increments(tone_times, inside_port_mask, before_tone_duration=2000, after_tone_duration=2000):
     """
     Calculates the average probability that a subject is in the port between sessions. 
@@ -100,6 +237,67 @@ def get_inside_port_probability_averages_for_all_increments(tone_times, inside_p
         result.append(inside_port_mask[tone_start_int - before_tone_duration: tone_start_int + after_tone_duration])
     return np.stack(result).mean(axis=0)
 
+def get_peri_tone_inside_port_averages(all_tone_times, all_inside_port_masks, before_tone_duration=2000, after_tone_duration=2000):
+    """
+    Calculates the average probability that a subject is in the port around the tones, for many sessions at once.
+    The windows of all the tones of all the sessions are taken from one combined mask with a single fancy index, instead of slicing each one.
+    The windows use the same indexes as get_inside_port_probability_averages_for_all_increments.
+    Increments of a window that are before the start or after the end of the mask are left out of the averages,
+    so tones close to the edges of a session only count for the increments that were recorded.
+
+    Args:
+        all_tone_times: list
+            - The tone times of every session, scaled the same way as the mask. NaNs are skipped.
+        all_inside_port_masks: list
+            - The inside port mask of every session. i.e. from get_inside_port_mask or get_inside_port_masks_for_sessions
+        before_tone_duration: int
+            - The number of increments before the tone to be analyzed
+        after_tone_duration: int
+            - The number of increments after the tone to be analyzed
+    Returns: 
+        dict
+            - "relative_increments": The increments relative to the tone, from -before_tone_duration to after_tone_duration - 1
+            - "session_averages": 2D Numpy Array with the average for every session and increment. NaN where a session has no tones with that increment.
+            - "session_counts": 2D Numpy Array with the number of tones that were averaged for every session and increment
+            - "pooled_averages": The average of all the tones of all the sessions for every increment
+            - "pooled_counts": The number of tones of all the sessions that were averaged for every increment
+    """
+    relative_increments = np.arange(-before_tone_duration, after_tone_duration)
+    num_sessions = len(all_inside_port_masks)
+    mask_lengths = np.array([len(inside_port_mask) for inside_port_mask in all_inside_port_masks], dtype=np.int64)
+    # Where each session starts in the combined mask
+    mask_offsets = np.zeros(num_sessions + 1, dtype=np.int64)
+    np.cumsum(mask_lengths, out=mask_offsets[1:])
+    combined_mask = np.concatenate([np.asarray(inside_port_mask, dtype=bool) for inside_port_mask in all_inside_port_masks] + [np.zeros(0, dtype=bool)])
+
+    tone_times = [np.asarray(session_tone_times, dtype=np.float64) for session_tone_times in all_tone_times]
+    tone_times = [session_tone_times[~np.isnan(session_tone_times)] for session_tone_times in tone_times]
+    tone_sessions = np.repeat(np.arange(num_sessions), [len(session_tone_times) for session_tone_times in tone_times])
+    tone_starts = np.concatenate(tone_times + [np.zeros(0)]).astype(np.int64)
+
+    # One row per tone, with the index of every increment of the window in its session's mask
+    window_indexes = tone_starts[:, np.newaxis] + relative_increments[np.newaxis, :]
+    is_recorded = (window_indexes >= 0) & (window_indexes < mask_lengths[tone_sessions][:, np.newaxis])
+    combined_indexes = np.where(is_recorded, window_indexes + mask_offsets[tone_sessions][:, np.newaxis], 0)
+    is_inside_port = is_recorded & combined_mask[combined_indexes] if len(combined_mask) else is_recorded
+
+    # Summing the rows of each session, the tones of a session are next to each other
+    session_sums = np.zeros((num_sessions, len(relative_increments)), dtype=np.int64)
+    session_counts = np.zeros((num_sessions, len(relative_increments)), dtype=np.int64)
+    sessions_with_tones = np.unique(tone_sessions)
+    if len(sessions_with_tones):
+        first_rows = np.searchsorted(tone_sessions, sessions_with_tones)
+        session_sums[sessions_with_tones] = np.add.reduceat(is_inside_port, first_rows, axis=0, dtype=np.int64)
+        session_counts[sessions_with_tones] = np.add.reduceat(is_recorded, first_rows, axis=0, dtype=np.int64)
+
+    pooled_sums = session_sums.sum(axis=0)
+    pooled_counts = session_counts.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        session_averages = np.where(session_counts > 0, session_sums / session_counts, np.nan)
+        pooled_averages = np.where(pooled_counts > 0, pooled_sums / pooled_counts, np.nan)
+    return {"relative_increments": relative_increments, "session_averages": session_averages, "session_counts": session_counts, \
+        "pooled_averages": pooled_averages, "pooled_counts": pooled_counts}
+
 def main():
     """
     Main function that runs when the script is run
@@ -5,7 +5,8 @@ Functions for processing tone information from MED-PC's output
 For more information on the MED-PC's programming language, Trans: 
 - https://www.med-associates.com/wp-content/uploads/2017/01/DOC-003-R3.4-SOF-735-MED-PC-IV-PROGRAMMER%E2%80%99S-MANUAL.pdf
 """
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 
 def get_max_tone_number(tone_pd_series):
@@ -53,6 +54,64 @@ def get_valid_tones(tone_pd_series, drop_1000s=True, dropna=True):
     # Removing all numbers that are after the max tone
     return tone_pd_series
 
+def get_sorted_valid_times(times):
+    """
+    Removes the NaNs from an array of times and sorts it, so that it can be searched with numpy.searchsorted.
+
+    Args:
+        times: Pandas Series or Numpy array
+            - Times of events, i.e. port entries. Can include NaNs from MED-PC's padding.
+    Returns:
+        Numpy array
+            - The sorted times as float64 without the NaNs
+    """
+    times = np.asarray(times, dtype=np.float64)
+    return np.sort(times[~np.isnan(times)])
+
+def get_first_times_after(sorted_times, query_times, inclusive=True):
+    """
+    For every query time, finds the first time that is after it. 
+
+    Args:
+        sorted_times: Numpy array
+            - Output of get_sorted_valid_times
+        query_times: Numpy array
+            - The times to search after. i.e. tone times
+        inclusive: bool
+            - Whether or not a time that is equal to the query time counts as being after it
+    Returns:
+        Numpy array
+            - The first time after every query time. NaN if the query time is NaN or there is no time after it.
+    """
+    query_times = np.asarray(query_times, dtype=np.float64)
+    indexes = np.searchsorted(sorted_times, query_times, side="left" if inclusive else "right")
+    is_found = (indexes < len(sorted_times)) & ~np.isnan(query_times)
+    first_times = np.full(len(query_times), np.nan)
+    first_times[is_found] = sorted_times[indexes[is_found]]
+    return first_times
+
+def get_last_times_before(sorted_times, query_times, inclusive=True):
+    """
+    For every query time, finds the last time that is before it. 
+
+    Args:
+        sorted_times: Numpy array
+            - Output of get_sorted_valid_times
+        query_times: Numpy array
+            - The times to search before. i.e. tone times
+        inclusive: bool
+            - Whether or not a time that is equal to the query time counts as being before it
+    Returns:
+        Numpy array
+            - The last time before every query time. NaN if the query time is NaN or there is no time before it.
+    """
+    query_times = np.asarray(query_times, dtype=np.float64)
+    indexes = np.searchsorted(sorted_times, query_times, side="right" if inclusive else "left") - 1
+    is_found = (indexes >= 0) & ~np.isnan(query_times)
+    last_times = np.full(len(query_times), np.nan)
+    last_times[is_found] = sorted_times[indexes[is_found]]
+    return last_times
+
 def get_first_port_entries_after_tone(tone_pd_series, port_entries_pd_series, port_exits_pd_series):
     """
     From an array of times of tones being played and subject's entries to a port, 
@@ -64,60 +123,161 @@ def get_first_port_entries_after_tone(tone_pd_series, port_entries_pd_series, po
             - All the times the tone is being played
         port_entries_pd_series: Pandas Series
             - All the times that the port is being entered
+        port_exits_pd_series: Pandas Series
+            - All the times that the port is being exited
     Returns: 
         Pandas DataFrame
-            - A dataframe of tone times to first port entry times
-    """
-    # Creating a dictionary of index(current row number we're on) to current/next tone time and first port entry
-    first_port_entry_dict = defaultdict(dict)
-    for index, current_tone_time in tone_pd_series.items():
-        # Using a counter so that we don't go through all the rows that include NaNs
-        try:
-            first_port_entry_dict[index]["current_tone_time"] = current_tone_time
-            # Getting all the port entries that happened after the tone started
-            # And then getting the first one of those port entries
-            first_port_entry_after_tone = port_entries_pd_series[port_entries_pd_series >= current_tone_time].min()
-            first_port_entry_dict[index]["first_port_entry_after_tone"] = first_port_entry_after_tone
-            # Getting all the port exits that happened after the entery
-            # And then getting the first one of those port exits
-            port_exit_after_first_port_entry_after_tone = port_exits_pd_series[port_exits_pd_series > first_port_entry_after_tone].min()
-            first_port_entry_dict[index]["port_exit_after_first_port_entry_after_tone"] = port_exit_after_first_port_entry_after_tone
-        except:
-            print("Look over value {} at index {}".format(current_tone_time, index))
-    return pd.DataFrame.from_dict(first_port_entry_dict, orient="index")
+            - A dataframe of tone times to first port entry times, with the same index as tone_pd_series
+            - NaN if there is no port entry (or exit) after the tone
+    """
+    # Searching sorted arrays of the entries and exits instead of filtering them for every tone
+    first_port_entry_after_tone = get_first_times_after(get_sorted_valid_times(port_entries_pd_series), tone_pd_series.to_numpy())
+    port_exit_after_first_port_entry_after_tone = get_first_times_after(get_sorted_valid_times(port_exits_pd_series), \
+        first_port_entry_after_tone, inclusive=False)
+    return pd.DataFrame({"current_tone_time": tone_pd_series.to_numpy(), \
+        "first_port_entry_after_tone": first_port_entry_after_tone, \
+        "port_exit_after_first_port_entry_after_tone": port_exit_after_first_port_entry_after_tone}, index=tone_pd_series.index)
 
 def get_last_port_entries_before_tone(tone_pd_series, port_entries_pd_series, port_exits_pd_series):
     """
     From an array of times of tones being played and subject's entries to a port, 
-    finds the first entry immediately after every tone. 
-    Makes a dataframe of tone times to first port entry times
+    finds the last entry immediately before every tone. 
+    Makes a dataframe of tone times to last port entry times
 
     Args:
         tone_pd_series: Pandas Series
             - All the times the tone is being played
         port_entries_pd_series: Pandas Series
             - All the times that the port is being entered
+        port_exits_pd_series: Pandas Series
+            - All the times that the port is being exited
     Returns: 
         Pandas DataFrame
-            - A dataframe of tone times to first port entry times
-    """
-    # Creating a dictionary of index(current row number we're on) to current/next tone time and first port entry
-    last_port_entry_dict = defaultdict(dict)
-    for index, current_tone_time in tone_pd_series.items():
-        # Using a counter so that we don't go through all the rows that include NaNs
-        try:
-            last_port_entry_dict[index]["current_tone_time"] = current_tone_time
-            # Getting all the port entries that happened after the tone started
-            # And then getting the first one of those port entries
-            last_port_entry_before_tone = port_entries_pd_series[port_entries_pd_series <= current_tone_time].max()
-            last_port_entry_dict[index]["last_port_entry_before_tone"] = last_port_entry_before_tone
-            # Getting all the port exits that happened after the entery
-            # And then getting the first one of those port exits
-            port_exit_after_last_port_entry_before_tone = port_exits_pd_series[port_exits_pd_series > last_port_entry_before_tone].min()
-            last_port_entry_dict[index]["port_exit_after_last_port_entry_before_tone"] = port_exit_after_last_port_entry_before_tone
-        except:
-            print("Look over value {} at index {}".format(current_tone_time, index))
-    return pd.DataFrame.from_dict(last_port_entry_dict, orient="index")
+            - A dataframe of tone times to last port entry times, with the same index as tone_pd_series
+            - NaN if there is no port entry before the tone, or no port exit after that entry
+    """
+    # Searching sorted arrays of the entries and exits instead of filtering them for every tone
+    last_port_entry_before_tone = get_last_times_before(get_sorted_valid_times(port_entries_pd_series), tone_pd_series.to_numpy())
+    port_exit_after_last_port_entry_before_tone = get_first_times_after(get_sorted_valid_times(port_exits_pd_series), \
+        last_port_entry_before_tone, inclusive=False)
+    return pd.DataFrame({"current_tone_time": tone_pd_series.to_numpy(), \
+        "last_port_entry_before_tone": last_port_entry_before_tone, \
+        "port_exit_after_last_port_entry_before_tone": port_exit_after_last_port_entry_before_tone}, index=tone_pd_series.index)
+
+def get_tone_port_entry_arrays(tone_times, port_entry_times, port_exit_times):
+    """
+    Finds the first port entry after, and the last port entry before, every tone of one session.
+    Along with the port exit after each of those entries, and the latencies from the tone.
+    The entries and exits are sorted once, and every tone is looked up with numpy.searchsorted.
+
+    Args:
+        tone_times: Numpy array
+            - The valid tone times of the session. i.e. the output of get_valid_tones
+        port_entry_times: Numpy array
+            - All the times that the port is being entered. Can include NaNs.
+        port_exit_times: Numpy array
+            - All the times that the port is being exited. Can include NaNs.
+    Returns:
+        dict
+            - Column name to Numpy array, with one value per tone. NaN where there is no matching entry or exit.
+    """
+    tone_times = np.asarray(tone_times)
+    sorted_port_entry_times = get_sorted_valid_times(port_entry_times)
+    sorted_port_exit_times = get_sorted_valid_times(port_exit_times)
+    first_port_entry_after_tone = get_first_times_after(sorted_port_entry_times, tone_times)
+    last_port_entry_before_tone = get_last_times_before(sorted_port_entry_times, tone_times)
+    return {
+        "current_tone_time": tone_times,
+        "first_port_entry_after_tone": first_port_entry_after_tone,
+        "port_exit_after_first_port_entry_after_tone": get_first_times_after(sorted_port_exit_times, first_port_entry_after_tone, inclusive=False),
+        "last_port_entry_before_tone": last_port_entry_before_tone,
+        "port_exit_after_last_port_entry_before_tone": get_first_times_after(sorted_port_exit_times, last_port_entry_before_tone, inclusive=False),
+        # How long after the tone the subject entered the port
+        "latency_to_first_port_entry_after_tone": first_port_entry_after_tone - tone_times,
+        # How long before the tone the subject last entered the port
+        "time_from_last_port_entry_before_tone": tone_times - last_port_entry_before_tone,
+    }
+
+def get_tone_port_entry_session_dataframe(session):
+    """
+    Makes the dataframe of get_tone_port_entry_arrays for one session, with the metadata as columns.
+    This is used by get_concatted_tone_port_entry_dataframe, and is run by the worker processes when there are any.
+
+    Args:
+        session: tuple
+            - The file path, the valid tone times, the port entry times, the port exit times, and a dictionary of metadata column to value
+    Returns:
+        Pandas DataFrame
+            - One row per tone
+    """
+    file_path, tone_times, port_entry_times, port_exit_times, meta_data = session
+    session_df = pd.DataFrame(get_tone_port_entry_arrays(tone_times, port_entry_times, port_exit_times))
+    session_df["file_path"] = file_path
+    for column, value in meta_data.items():
+        session_df[column] = value
+    return session_df
+
+def get_concatted_tone_port_entry_dataframe(concatted_medpc_df, tone_time_column="(S)CSpresentation", \
+        port_entry_column="(P)Portentry", port_exit_column="(N)Portexit", subject_column="subject", date_column="date", \
+        stop_with_error=False, max_workers=None, chunksize=16):
+    """
+    Creates one dataframe of the first port entry after, and the last port entry before, every tone of every session.
+    Along with the matching port exits, the latencies, and the corresponding metadata of the path of the file, the date, and the subject.
+    The dataframe is grouped by the file path once, instead of being filtered for every file.
+
+    Args:
+        concatted_medpc_df: Pandas Dataframe 
+            - Output of extract.dataframe.get_medpc_dataframe_from_list_of_files
+            - Includes tone playing time, port entry time, subject, and date for each recording session
+        tone_time_column: str
+            - Name of the column of concatted_medpc_df that has the array tone times
+        port_entry_column: str
+            - Name of the column of concatted_medpc_df that has the array port entry times
+        port_exit_column: str
+            - Name of the column of concatted_medpc_df that has the array port exit times
+        subject_column: str
+            - Name of the column of concatted_medpc_df that has the subject's ID
+        date_column: str
+            - Name of the column of concatted_medpc_df that has the date of the recording
+        stop_with_error: bool
+            - Flag to terminate the program when an error is raised.
+            - Sometimes recordings can be for testing and don't include any valid tone times
+        max_workers: int or None
+            - Number of processes to split the sessions across. If None, the sessions are processed in this process.
+        chunksize: int
+            - Number of sessions sent to a process at a time
+    
+    Returns: 
+        Pandas Dataframe
+            - One row per tone, with the columns of get_tone_port_entry_arrays and then the file path, date, and subject
+    """
+    all_sessions = []
+    for file_path, current_file_df in concatted_medpc_df.groupby("file_path", sort=False):
+        valid_tones = get_valid_tones(tone_pd_series=current_file_df[tone_time_column])
+        # Sometimes the valid tones do not exist because it was a test recording
+        if valid_tones.empty:
+            if stop_with_error:
+                raise ValueError("No valid tones for {}".format(file_path))
+            print("No valid tones for {}".format(file_path))
+            continue
+        # Making sure that there is only one date and subject for all the rows
+        meta_data = {}
+        if current_file_df[date_column].nunique(dropna=False) == 1 and current_file_df[subject_column].nunique(dropna=False) == 1:
+            meta_data = {date_column: current_file_df[date_column].iloc[0], subject_column: current_file_df[subject_column].iloc[0]}
+        elif stop_with_error:
+            raise ValueError("More then one date or subject in {}".format(file_path))
+        else:
+            print("More then one date or subject in {}".format(file_path))
+        all_sessions.append((file_path, valid_tones.to_numpy(), current_file_df[port_entry_column].to_numpy(), \
+            current_file_df[port_exit_column].to_numpy(), meta_data))
+
+    if max_workers is None:
+        all_session_df = [get_tone_port_entry_session_dataframe(session) for session in all_sessions]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            all_session_df = list(executor.map(get_tone_port_entry_session_dataframe, all_sessions, chunksize=chunksize))
+    # Index repeats itself because it is concatenated with multiple dataframes
+    return pd.concat(all_session_df).reset_index(drop=True)
 
 def get_concatted_first_porty_entry_after_tone_dataframe(concatted_medpc_df, tone_time_column="(S)CSpresentation", \
         port_entry_column="(P)Portentry", port_exit_column="(N)Portexit", subject_column="subject", date_column="date", \
@@ -148,34 +308,12 @@ def get_concatted_first_porty_entry_after_tone_dataframe(concatted_medpc_df, ton
         Pandas Dataframe
             -
     """
-    # List to combine all the Data Frames at the end
-    all_first_port_entry_df = []
-    for file_path in concatted_medpc_df["file_path"].unique():
-        current_file_df = concatted_medpc_df[concatted_medpc_df["file_path"] == file_path]
-        valid_tones = get_valid_tones(tone_pd_series=current_file_df[tone_time_column])
-        # Sometimes the valid tones do not exist because it was a test recording
-        if not valid_tones.empty:
-            # All the first port entries for each tone            
-            first_port_entry_df = get_first_port_entries_after_tone(tone_pd_series=valid_tones, \
-                port_entries_pd_series=current_file_df[port_entry_column], port_exits_pd_series=current_file_df[port_exit_column])
-            # Adding the metadata as columns
-            first_port_entry_df["file_path"] = file_path
-            # Making sure that there is only one date and subject for all the rows
-            if len(current_file_df[date_column].unique()) == 1 and len(current_file_df[subject_column].unique()) == 1:
-                # This assumes that all the date and subject keys are the same for the file
-                first_port_entry_df[date_column] = current_file_df[date_column].unique()[0]
-                first_port_entry_df[subject_column] = current_file_df[subject_column].unique()[0]
-            elif stop_with_error:
-                raise ValueError("More then one date or subject in {}".format(file_path))
-            else:
-                print("More then one date or subject in {}".format(file_path))
-            all_first_port_entry_df.append(first_port_entry_df)
-        elif valid_tones.empty and stop_with_error:
-            raise ValueError("No valid tones for {}".format(file_path))
-        else:
-            print("No valid tones for {}".format(file_path))
-    # Index repeats itself because it is concatenated with multiple dataframes
-    return pd.concat(all_first_port_entry_df).reset_index(drop="True")
+    # All the sessions are processed together, and only the columns for the first port entries are kept
+    tone_port_entry_df = get_concatted_tone_port_entry_dataframe(concatted_medpc_df, tone_time_column=tone_time_column, \
+        port_entry_column=port_entry_column, port_exit_column=port_exit_column, subject_column=subject_column, date_column=date_column, \
+        stop_with_error=stop_with_error)
+    columns = ["current_tone_time", "first_port_entry_after_tone", "port_exit_after_first_port_entry_after_tone", "file_path", date_column, subject_column]
+    return tone_port_entry_df[[column for column in columns if column in tone_port_entry_df.columns]]
 
 def get_concatted_last_porty_entry_before_tone_dataframe(concatted_medpc_df, tone_time_column="(S)CSpresentation", \
         port_entry_column="(P)Portentry", port_exit_column="(N)Portexit", subject_column="subject", date_column="date", \
@@ -206,34 +344,12 @@ def get_concatted_last_porty_entry_before_tone_dataframe(concatted_medpc_df, ton
         Pandas Dataframe
             -
     """
-    # List to combine all the Data Frames at the end
-    all_last_port_entry_df = []
-    for file_path in concatted_medpc_df["file_path"].unique():
-        current_file_df = concatted_medpc_df[concatted_medpc_df["file_path"] == file_path]
-        valid_tones = get_valid_tones(tone_pd_series=current_file_df[tone_time_column])
-        # Sometimes the valid tones do not exist because it was a test recording
-        if not valid_tones.empty:
-            # All the first port entries for each tone            
-            last_port_entry_df = get_last_port_entries_before_tone(tone_pd_series=valid_tones, \
-                port_entries_pd_series=current_file_df[port_entry_column], port_exits_pd_series=current_file_df[port_exit_column])
-            # Adding the metadata as columns
-            last_port_entry_df["file_path"] = file_path
-            # Making sure that there is only one date and subject for all the rows
-            if len(current_file_df[date_column].unique()) == 1 and len(current_file_df[subject_column].unique()) == 1:
-                # This assumes that all the date and subject keys are the same for the file
-                last_port_entry_df[date_column] = current_file_df[date_column].unique()[0]
-                last_port_entry_df[subject_column] = current_file_df[subject_column].unique()[0]
-            elif stop_with_error:
-                raise ValueError("More then one date or subject in {}".format(file_path))
-            else:
-                print("More then one date or subject in {}".format(file_path))
-            all_last_port_entry_df.append(last_port_entry_df)
-        elif valid_tones.empty and stop_with_error:
-            raise ValueError("No valid tones for {}".format(file_path))
-        else:
-            print("No valid tones for {}".format(file_path))
-    # Index repeats itself because it is concatenated with multiple dataframes
-    return pd.concat(all_last_port_entry_df).reset_index(drop="True")
+    # All the sessions are processed together, and only the columns for the last port entries are kept
+    tone_port_entry_df = get_concatted_tone_port_entry_dataframe(concatted_medpc_df, tone_time_column=tone_time_column, \
+        port_entry_column=port_entry_column, port_exit_column=port_exit_column, subject_column=subject_column, date_column=date_column, \
+        stop_with_error=stop_with_error)
+    columns = ["current_tone_time", "last_port_entry_before_tone", "port_exit_after_last_port_entry_before_tone", "file_path", date_column, subject_column]
+    return tone_port_entry_df[[column for column in columns if column in tone_port_entry_df.columns]]
 
 def main():
     """
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Functions for making a table of the trials of reward competition sessions from MED-PC's output
+
+Every tone is a trial, and every subject in the same competition gets a row for it.
+The tones, port entries and port exits of every file are searched with numpy.searchsorted in the time base of that file,
+and then the trials of all the files are combined to find the winner of every trial of every competition.
+
+For more information on the MED-PC's programming language, Trans:
+- https://www.med-associates.com/wp-content/uploads/2017/01/DOC-003-R3.4-SOF-735-MED-PC-IV-PROGRAMMER%E2%80%99S-MANUAL.pdf
+"""
+import os
+import numpy as np
+import pandas as pd
+from extract.metadata import read_med_pc_meta_data_header
+from processing.port import get_port_occupancy_intervals
+from processing.tone import get_valid_tones, get_sorted_valid_times, get_first_times_after
+
+def get_competition_session(file_path, box, box_to_competition, separator="_Subject"):
+    """
+    Gets the name of the competition that a MED-PC file was recorded in.
+    The files of the boxes that were run together start with the same name, but more than one competition can be run at the same time in different boxes.
+    So the competition is the directory, the start of the file name and the boxes that compete with each other.
+    i.e. "./data/2023-05-27_10h03m_Subject 2.1.txt" in box 3, with boxes 3 and 4 competing, becomes "./data/2023-05-27_10h03m_boxes_3-4"
+
+    Args:
+        file_path: str
+            - Path to the MED-PC file
+        box: int or str
+            - The box that the file was recorded in, from the "Box" header of the file
+        box_to_competition: dict
+            - The box number to the name of the boxes it competes with. i.e. {1: "1-2", 2: "1-2", 3: "3-4", 4: "3-4"}
+        separator: str
+            - The part of the file name that comes right after the start time
+    Returns:
+        str
+            - The name of the competition
+    """
+    start = os.path.basename(file_path).split(separator)[0]
+    return os.path.join(os.path.dirname(file_path), "{}_boxes_{}".format(start, box_to_competition[int(box)]))
+
+def add_competition_session_column(concatted_medpc_df, box_to_competition, session_column="session", separator="_Subject"):
+    """
+    Adds a column with the competition of every file, to use as the session_column of get_trial_dataframe.
+    The box of every file is read from the header of the file. See get_competition_session.
+
+    Args:
+        concatted_medpc_df: Pandas Dataframe
+            - Output of extract.dataframe.get_medpc_dataframe_from_list_of_files, with a "file_path" column
+        box_to_competition: dict
+            - The box number to the name of the boxes it competes with. i.e. {1: "1-2", 2: "1-2", 3: "3-4", 4: "3-4"}
+        session_column: str
+            - Name of the column to add
+        separator: str
+            - The part of the file name that comes right after the start time
+    Returns:
+        Pandas Dataframe
+            - A copy of concatted_medpc_df with the session column
+    """
+    file_path_to_session = {}
+    for file_path in concatted_medpc_df["file_path"].unique():
+        box = read_med_pc_meta_data_header(file_path, meta_data_headers=["Box"]).get("Box")
+        if box is None:
+            raise ValueError("The file {} does not have a Box header".format(file_path))
+        file_path_to_session[file_path] = get_competition_session(file_path, box, box_to_competition, separator=separator)
+    concatted_medpc_df = concatted_medpc_df.copy()
+    concatted_medpc_df[session_column] = concatted_medpc_df["file_path"].map(file_path_to_session)
+    return concatted_medpc_df
+
+def get_time_inside_intervals_before(interval_starts, interval_stops, times):
+    """
+    For every time, gets how much of the intervals happened before it.
+    The difference between two times is how long was spent inside the intervals between them.
+
+    Args:
+        interval_starts: Numpy array
+            - The sorted starts of intervals that don't overlap. i.e. from processing.port.get_port_occupancy_intervals
+        interval_stops: Numpy array
+            - The stops of the intervals
+        times: Numpy array
+            - The times to measure up to
+    Returns:
+        Numpy array
+            - The total duration of the intervals before every time
+    """
+    interval_durations = interval_stops - interval_starts
+    cumulative_durations = np.concatenate([[0.0], np.cumsum(interval_durations)])
+    # The number of intervals that started at or before each time. Only the last of those can still be going on.
+    num_started = np.searchsorted(interval_starts, times, side="right")
+    last_interval = np.maximum(num_started - 1, 0)
+    time_in_last_interval = np.clip(times - interval_starts[last_interval] if len(interval_starts) else np.zeros(len(times)), \
+        0, interval_durations[last_interval] if len(interval_starts) else 0)
+    return np.where(num_started > 0, cumulative_durations[last_interval] + time_in_last_interval, 0.0)
+
+def get_trial_dataframe(concatted_medpc_df, session_column, tone_duration=10, baseline_start_before_tone=30, baseline_stop_before_tone=20, \
+        tone_time_column="(S)CSpresentation", port_entry_column="(P)Portentry", port_exit_column="(N)Portexit", subject_column="subject"):
+    """
+    Creates a dataframe with one row per trial (tone) and subject, for all the files at once.
+    The subjects that were recorded in the same session compete for the reward,
+    and the winner of each trial is the subject that entered the port first while the tone was playing.
+
+    Args:
+        concatted_medpc_df: Pandas Dataframe
+            - Output of extract.dataframe.get_medpc_dataframe_from_list_of_files
+            - Includes tone playing time, port entry time, port exit time and subject for each recording session
+        session_column: str
+            - Name of the column of concatted_medpc_df that has the session, which is the competition that the file was recorded in
+            - The files of different cages can start at the same time, so the session has to identify the boxes that compete.
+            See add_competition_session_column.
+        tone_duration: float
+            - How long each tone plays for, in the same units as the times
+        baseline_start_before_tone: float
+            - How long before the tone the baseline window starts
+        baseline_stop_before_tone: float
+            - How long before the tone the baseline window stops
+        tone_time_column: str
+            - Name of the column of concatted_medpc_df that has the array tone times
+        port_entry_column: str
+            - Name of the column of concatted_medpc_df that has the array port entry times
+        port_exit_column: str
+            - Name of the column of concatted_medpc_df that has the array port exit times
+        subject_column: str
+            - Name of the column of concatted_medpc_df that has the subject's ID
+    Returns:
+        Pandas Dataframe
+            - One row per tone of every file, with the columns:
+                - "session", "file_path", "subject" and "trial_number" (starting at 0 for each file)
+                - "tone_start" and "tone_stop"
+                - "first_port_entry_after_tone": The first port entry at or after the start of the tone. NaN if there isn't one.
+                - "first_port_entry_latency": How long after the start of the tone that port entry was
+                - "time_in_port": How long the subject was in the port while the tone was playing
+                - "is_winner": Whether or not the subject entered the port first during the tone, out of all the subjects of the session
+                - "winner": The subject that won the trial. NaN if no subject entered the port during the tone, or if more than one entered first.
+                - "baseline_start" and "baseline_stop": The window before the tone to use as the baseline
+    """
+    if session_column not in concatted_medpc_df.columns:
+        raise ValueError("concatted_medpc_df does not have the session column {}, see add_competition_session_column".format(session_column))
+    file_codes, file_paths = pd.factorize(concatted_medpc_df["file_path"])
+
+    # The tones of every file are searched in the port entries and exits of that file only
+    all_tone_starts = [np.zeros(0)]
+    all_tone_file_codes = [np.zeros(0, dtype=np.int64)]
+    all_first_port_entry_after_tone = [np.zeros(0)]
+    all_time_in_port = [np.zeros(0)]
+    for file_code, current_file_df in concatted_medpc_df.groupby(file_codes, sort=True):
+        tone_starts = get_valid_tones(tone_pd_series=current_file_df[tone_time_column]).to_numpy(dtype=np.float64)
+        all_tone_starts.append(tone_starts)
+        all_tone_file_codes.append(np.full(len(tone_starts), file_code, dtype=np.int64))
+        all_first_port_entry_after_tone.append(get_first_times_after(get_sorted_valid_times(current_file_df[port_entry_column]), tone_starts))
+
+        # How long the subject was in the port during every tone, from the merged durations that the subject was in the port
+        interval_starts, interval_stops = get_port_occupancy_intervals(current_file_df[port_entry_column], current_file_df[port_exit_column], \
+            inclusive_stops=False)
+        all_time_in_port.append(get_time_inside_intervals_before(interval_starts, interval_stops, tone_starts + tone_duration) - \
+            get_time_inside_intervals_before(interval_starts, interval_stops, tone_starts))
+    tone_starts = np.concatenate(all_tone_starts)
+    tone_file_codes = np.concatenate(all_tone_file_codes)
+    first_port_entry_after_tone = np.concatenate(all_first_port_entry_after_tone)
+
+    # The metadata of every file
+    file_meta_data_df = concatted_medpc_df.groupby(file_codes, sort=True)[[subject_column, session_column]].first()
+
+    trial_df = pd.DataFrame({
+        "session": file_meta_data_df[session_column].to_numpy()[tone_file_codes],
+        "file_path": np.asarray(file_paths, dtype=object)[tone_file_codes],
+        "subject": file_meta_data_df[subject_column].to_numpy()[tone_file_codes],
+        "trial_number": np.arange(len(tone_starts)) - np.searchsorted(tone_file_codes, tone_file_codes, side="left"),
+        "tone_start": tone_starts,
+        "tone_stop": tone_starts + tone_duration,
+        "first_port_entry_after_tone": first_port_entry_after_tone,
+        "first_port_entry_latency": first_port_entry_after_tone - tone_starts,
+        "time_in_port": np.concatenate(all_time_in_port),
+    })
+
+    # The winner is the only subject of the session with the shortest latency, out of the subjects that entered during the tone
+    latency_during_tone = trial_df["first_port_entry_latency"].where(trial_df["first_port_entry_after_tone"] < trial_df["tone_stop"])
+    shortest_latency = latency_during_tone.groupby([trial_df["session"], trial_df["trial_number"]]).transform("min")
+    is_shortest = latency_during_tone == shortest_latency
+    num_shortest = is_shortest.groupby([trial_df["session"], trial_df["trial_number"]]).transform("sum")
+    trial_df["is_winner"] = is_shortest & (num_shortest == 1)
+    winner_df = trial_df.loc[trial_df["is_winner"], ["session", "trial_number", "subject"]].rename(columns={"subject": "winner"})
+    trial_df = trial_df.merge(winner_df, on=["session", "trial_number"], how="left")
+
+    trial_df["baseline_start"] = trial_df["tone_start"] - baseline_start_before_tone
+    trial_df["baseline_stop"] = trial_df["tone_start"] - baseline_stop_before_tone
+    return trial_df
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+if __name__ == '__main__':
+    main()
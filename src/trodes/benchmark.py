@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for reading Trodes extracted data files.
+
+A synthetic Trodes export is written with a valid settings block and structured data,
+and then the functions in `trodes.read_exported` are timed on it.
+Every benchmark runs in a new process, so that the peak memory of one benchmark does not carry over to the next.
+The wall times and peak memory are saved to JSON so that they can be compared between versions.
+
+Example:
+    cd src && python -m trodes.benchmark --num_samples 10000000 --num_channels 32 --output_path trodes_benchmark.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import resource
+import multiprocessing
+import numpy as np
+import trodes.read_exported
+
+def write_synthetic_trodes_file(file_path, fields, data, settings=None):
+    """
+    Writes a file in the same format as the files exported by Trodes.
+    A settings block followed by the data as binary.
+
+    Args:
+        file_path (str): The path of the file to write.
+        fields (str): The fields setting, i.e. "<voltage int16>". Must match the data type of the data.
+        data (numpy.ndarray): The data to write after the settings block.
+        settings (dict, optional): Other settings to add to the settings block.
+    """
+    if settings is None:
+        settings = {}
+    lines = ["<Start settings>"]
+    lines += [f"{key}: {value}" for key, value in settings.items()]
+    lines += [f"Fields: {fields}", "<End settings>"]
+    with open(file_path, "wb") as f:
+        f.write(("\n".join(lines) + "\n").encode("ascii"))
+        data.tofile(f)
+
+def create_synthetic_trodes_export(dir_path, prefix="synthetic", num_samples=1000000, num_channels=32, decimation=20, num_dio_channels=4, seed=0):
+    """
+    Creates a directory like the one that Trodes makes when exporting a recording, with random data.
+    It has the subdirectories:
+        - "{prefix}.LFP": One LFP file per nTrode and the LFP timestamps
+        - "{prefix}.DIO": One DIO file per channel with alternating states
+        - "{prefix}.timestamps": The timestamps of every sample
+        - "{prefix}.raw": The raw signal of all the channels in one file
+
+    Args:
+        dir_path (str): The path of the directory to create the subdirectories in.
+        prefix (str): The name of the recording.
+        num_samples (int): The number of samples in the raw signal.
+        num_channels (int): The number of channels, with one nTrode per channel.
+        decimation (int): The number of raw samples per LFP sample.
+        num_dio_channels (int): The number of DIO channels.
+        seed (int): Seed for the random data.
+
+    Returns:
+        str: The path of the directory.
+    """
+    random_generator = np.random.default_rng(seed)
+    settings = {"Description": "Synthetic data", "Byte_order": "little endian", "Clockrate": 30000, "First_timestamp": 0}
+    num_lfp_samples = num_samples // decimation
+    timestamps = np.arange(num_samples, dtype="<u4")
+
+    lfp_dir = os.path.join(dir_path, f"{prefix}.LFP")
+    os.makedirs(lfp_dir, exist_ok=True)
+    for ntrode_id in range(1, num_channels + 1):
+        lfp = random_generator.integers(-2000, 2000, size=num_lfp_samples, dtype="<i2")
+        write_synthetic_trodes_file(os.path.join(lfp_dir, f"{prefix}.LFP_nt{ntrode_id}ch1.dat"), "<voltage int16>", lfp,
+            dict(settings, nTrode_ID=ntrode_id, nTrode_channel=1, Voltage_scaling=0.195, Decimation=decimation))
+    write_synthetic_trodes_file(os.path.join(lfp_dir, f"{prefix}.timestamps.dat"), "<time uint32>", timestamps[::decimation], settings)
+
+    dio_dir = os.path.join(dir_path, f"{prefix}.DIO")
+    os.makedirs(dio_dir, exist_ok=True)
+    dio_dtype = np.dtype([("time", "<u4"), ("state", "u1")])
+    for dio_channel in range(1, num_dio_channels + 1):
+        dio = np.zeros(max(num_samples // 30000, 1), dtype=dio_dtype)
+        dio["time"] = np.sort(random_generator.choice(num_samples, size=len(dio), replace=False))
+        dio["state"] = np.arange(len(dio)) % 2
+        write_synthetic_trodes_file(os.path.join(dio_dir, f"{prefix}.dio_Din{dio_channel}.dat"), "<time uint32><state uint8>", dio, settings)
+
+    timestamps_dir = os.path.join(dir_path, f"{prefix}.timestamps")
+    os.makedirs(timestamps_dir, exist_ok=True)
+    write_synthetic_trodes_file(os.path.join(timestamps_dir, f"{prefix}.timestamps.dat"), "<time uint32>", timestamps, settings)
+
+    raw_dir = os.path.join(dir_path, f"{prefix}.raw")
+    os.makedirs(raw_dir, exist_ok=True)
+    raw = random_generator.integers(-2000, 2000, size=(num_samples, num_channels), dtype="<i2")
+    write_synthetic_trodes_file(os.path.join(raw_dir, f"{prefix}.raw_group0.dat"), f"<voltage {num_channels}*int16>", raw, settings)
+    return dir_path
+
+def _get_peak_rss_bytes():
+    """
+    Gets the peak resident memory of the current process in bytes. Linux reports it in kilobytes, and macOS in bytes.
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+def _touch_result(result):
+    """
+    Reads every array in the result of a reader, so that memory maps are included in the timing.
+    """
+    if isinstance(result, np.ndarray):
+        return float(np.sum(result[result.dtype.names[0]] if result.dtype.names else result, dtype=np.float64))
+    if isinstance(result, dict):
+        return sum(_touch_result(value) for value in result.values())
+    return 0.0
+
+def _run_benchmark_in_process(connection, function, args, kwargs, number, touch):
+    """
+    Runs a function `number` times in a new process and sends back the wall times and the peak memory.
+    """
+    try:
+        start_rss_bytes = _get_peak_rss_bytes()
+        wall_times = []
+        for _ in range(number):
+            start_time = time.perf_counter()
+            result = function(*args, **kwargs)
+            if touch:
+                _touch_result(result)
+            wall_times.append(time.perf_counter() - start_time)
+            del result
+        connection.send({"wall_times": wall_times, "start_rss_bytes": start_rss_bytes, "peak_rss_bytes": _get_peak_rss_bytes()})
+    except Exception as e:
+        connection.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        connection.close()
+
+def run_benchmark(name, function, args=(), kwargs=None, repeats=3, number=1, touch=False):
+    """
+    Times a function in a new process.
+
+    Args:
+        name (str): Name of the benchmark.
+        function (callable): The function to time. Must be importable by the new process.
+        args (tuple): Positional arguments for the function.
+        kwargs (dict, optional): Keyword arguments for the function.
+        repeats (int): The number of processes to run the benchmark in. The best one is reported.
+        number (int): The number of times to call the function in each process.
+        touch (bool): To read all the arrays that the function returns, so that lazy reads are included in the time.
+
+    Returns:
+        dict: With the name, the wall time of every call, the best and median wall time per call,
+            and the peak resident memory of the process before and after the calls.
+    """
+    if kwargs is None:
+        kwargs = {}
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(repeats):
+        parent_connection, child_connection = context.Pipe(duplex=False)
+        process = context.Process(target=_run_benchmark_in_process, args=(child_connection, function, args, kwargs, number, touch))
+        process.start()
+        child_connection.close()
+        run = parent_connection.recv()
+        process.join()
+        if "error" in run:
+            return {"name": name, "error": run["error"]}
+        runs.append(run)
+
+    wall_times = [wall_time for run in runs for wall_time in run["wall_times"]]
+    return {
+        "name": name,
+        "number": number,
+        "wall_times": wall_times,
+        "best_wall_time": min(wall_times),
+        "median_wall_time": float(np.median(wall_times)),
+        "start_rss_bytes": min(run["start_rss_bytes"] for run in runs),
+        "peak_rss_bytes": max(run["peak_rss_bytes"] for run in runs),
+    }
+
+def run_trodes_benchmarks(num_samples=1000000, num_channels=32, repeats=3, work_dir=None, output_path=None):
+    """
+    Creates a synthetic Trodes export and times the readers in `trodes.read_exported` on it.
+
+    Args:
+        num_samples (int): The number of samples in the raw signal of the synthetic export.
+        num_channels (int): The number of channels in the synthetic export.
+        repeats (int): The number of processes to run each benchmark in.
+        work_dir (str, optional): Directory to write the synthetic export to. Defaults to a temporary directory that is removed afterwards.
+        output_path (str, optional): Path of the JSON file to save the results to.
+
+    Returns:
+        dict: The parameters, the environment and the results of every benchmark.
+    """
+    remove_work_dir = work_dir is None
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(prefix="trodes_benchmark_")
+    prefix = "synthetic"
+    try:
+        create_synthetic_trodes_export(work_dir, prefix=prefix, num_samples=num_samples, num_channels=num_channels)
+        lfp_dir = os.path.join(work_dir, f"{prefix}.LFP")
+        lfp_file = os.path.join(lfp_dir, f"{prefix}.LFP_nt1ch1.dat")
+        raw_file = os.path.join(work_dir, f"{prefix}.raw", f"{prefix}.raw_group0.dat")
+        fields = f"<time uint32><voltage {num_channels}*int16><state uint8>"
+
+        benchmarks = [
+            ("parse_fields", trodes.read_exported.parse_fields, (fields,), {}, 10000, False),
+            ("read_trodes_extracted_data_file[lfp]", trodes.read_exported.read_trodes_extracted_data_file, (lfp_file,), {}, 1, True),
+            ("read_trodes_extracted_data_file[raw]", trodes.read_exported.read_trodes_extracted_data_file, (raw_file,), {}, 1, True),
+            ("read_trodes_extracted_data_file[raw, mmap]", trodes.read_exported.read_trodes_extracted_data_file, (raw_file,), {"mmap": True}, 1, True),
+            ("organize_single_trodes_export[lfp]", trodes.read_exported.organize_single_trodes_export, (lfp_dir,), {}, 1, True),
+            ("organize_all_trodes_export", trodes.read_exported.organize_all_trodes_export, (work_dir,), {}, 1, True),
+        ]
+        results = [run_benchmark(name, function, args=args, kwargs=kwargs, repeats=repeats, number=number, touch=touch)
+            for name, function, args, kwargs, number, touch in benchmarks]
+    finally:
+        if remove_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "parameters": {"num_samples": num_samples, "num_channels": num_channels, "repeats": repeats},
+        "environment": {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform()},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if output_path is not None:
+        with open(output_path, "w") as f:
+            json.dump(report, f, indent=4)
+    return report
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for reading Trodes extracted data files")
+    parser.add_argument("--num_samples", type=int, default=1000000, help="Number of samples in the raw signal of the synthetic export")
+    parser.add_argument("--num_channels", type=int, default=32, help="Number of channels in the synthetic export")
+    parser.add_argument("--repeats", type=int, default=3, help="Number of processes to run each benchmark in")
+    parser.add_argument("--work_dir", default=None, help="Directory to write the synthetic export to")
+    parser.add_argument("--output_path", default="trodes_benchmark.json", help="Path of the JSON file for the results")
+    args = parser.parse_args()
+
+    report = run_trodes_benchmarks(num_samples=args.num_samples, num_channels=args.num_channels, repeats=args.repeats,
+        work_dir=args.work_dir, output_path=args.output_path)
+    for result in report["results"]:
+        if "error" in result:
+            print(f"{result['name']}: {result['error']}")
+        else:
+            print(f"{result['name']}: {result['best_wall_time']:.4f} s, peak RSS {result['peak_rss_bytes'] / 1024 ** 2:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of parsed Trodes extracted data files.
+
+Each file is cached in its own directory as a `.npy` file of the records and a JSON sidecar of the settings.
+The cache key is made from the absolute path, the size and the modification time of the original file,
+so a file that is exported again gets a new entry. Later reads are memory maps of the `.npy` file without any parsing.
+The total size of the cache is kept under a quota by removing the entries that were used least recently.
+"""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from trodes.read_exported import read_trodes_extracted_data_file
+
+# Default location of the cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "trodes_extracted_data")
+# Default maximum size of the cache, 20 GiB
+DEFAULT_QUOTA_BYTES = 20 * 1024 ** 3
+# Names of the files in each cache entry
+DATA_FILE_NAME = "data.npy"
+SETTINGS_FILE_NAME = "settings.json"
+
+def get_trodes_cache_key(filename):
+    """
+    Creates the cache key of a Trodes extracted data file from its absolute path, size and modification time.
+
+    Args:
+        filename (str): The path to the Trodes file.
+
+    Returns:
+        str: Hex digest that is used as the name of the cache entry directory.
+    """
+    absolute_file_path = os.path.abspath(filename)
+    file_stat = os.stat(absolute_file_path)
+    key_text = f"{absolute_file_path}|{file_stat.st_size}|{file_stat.st_mtime_ns}"
+    return hashlib.sha1(key_text.encode("utf-8")).hexdigest()
+
+def _get_directory_size(dir_path):
+    """
+    Gets the total size in bytes of the files in a directory.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(dir_path) if entry.is_file())
+
+def evict_trodes_cache(cache_dir=DEFAULT_CACHE_DIR, quota_bytes=DEFAULT_QUOTA_BYTES, keep=None):
+    """
+    Removes the least recently used entries of the cache until its total size is within the quota.
+    The last use of an entry is the modification time of its settings file, which is updated on every read.
+
+    Args:
+        cache_dir (str): Path of the cache directory.
+        quota_bytes (int): The maximum total size of the cache in bytes.
+        keep (str, optional): Key of an entry that should not be removed, i.e. the one that was just added.
+
+    Returns:
+        list: Keys of the entries that were removed.
+    """
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        settings_path = os.path.join(entry.path, SETTINGS_FILE_NAME)
+        # Skipping anything that is not a complete entry, like entries that are still being written
+        if entry.is_dir() and os.path.exists(settings_path):
+            entries.append((os.stat(settings_path).st_mtime_ns, entry.name, _get_directory_size(entry.path)))
+
+    total_size = sum(size for _, _, size in entries)
+    removed_keys = []
+    # Going from the oldest to the newest entry
+    for _, key, size in sorted(entries):
+        if total_size <= quota_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, key), ignore_errors=True)
+        total_size -= size
+        removed_keys.append(key)
+    return removed_keys
+
+def read_trodes_extracted_data_file_cached(filename, cache_dir=DEFAULT_CACHE_DIR, quota_bytes=DEFAULT_QUOTA_BYTES):
+    """
+    Reads a Trodes extracted data file through the cache.
+    The first read parses the file with `read_trodes_extracted_data_file` and saves it to the cache.
+    Every read after that memory maps the cached `.npy` file.
+
+    Args:
+        filename (str): The path to the Trodes file to be read.
+        cache_dir (str): Path of the cache directory. It is created if it doesn't exist.
+        quota_bytes (int): The maximum total size of the cache in bytes. Older entries are removed when a new one is added.
+
+    Returns:
+        dict: The same dictionary as `read_trodes_extracted_data_file`, with the data under the 'data' key as a read-only memory map.
+    """
+    key = get_trodes_cache_key(filename)
+    entry_dir = os.path.join(cache_dir, key)
+    settings_path = os.path.join(entry_dir, SETTINGS_FILE_NAME)
+
+    if not os.path.exists(settings_path):
+        os.makedirs(cache_dir, exist_ok=True)
+        fields_text = read_trodes_extracted_data_file(filename, mmap=True)
+        data = fields_text.pop("data")
+        # Writing into a temporary directory first so that an interrupted write never looks like a complete entry
+        temporary_dir = tempfile.mkdtemp(dir=cache_dir, prefix=f".{key}.")
+        try:
+            np.save(os.path.join(temporary_dir, DATA_FILE_NAME), data)
+            with open(os.path.join(temporary_dir, SETTINGS_FILE_NAME), "w") as f:
+                json.dump({"source_path": os.path.abspath(filename), "settings": fields_text}, f)
+            os.replace(temporary_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(temporary_dir, ignore_errors=True)
+            # Another process might have added the same entry at the same time
+            if not os.path.exists(settings_path):
+                raise
+        evict_trodes_cache(cache_dir=cache_dir, quota_bytes=quota_bytes, keep=key)
+    else:
+        # Marking the entry as recently used
+        os.utime(settings_path)
+
+    with open(settings_path) as f:
+        fields_text = json.load(f)["settings"]
+    fields_text["data"] = np.load(os.path.join(entry_dir, DATA_FILE_NAME), mmap_mode="r")
+    return fields_text
+
+def clear_trodes_cache(cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Removes every entry of the cache.
+
+    Args:
+        cache_dir (str): Path of the cache directory.
+    """
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()
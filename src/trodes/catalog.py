@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Header-only catalog of Trodes extracted data files.
+
+Only the settings block of each file is read. The number of samples is computed from the size of the file,
+so a catalog of a whole cohort can be built without loading any samples.
+The catalog is stored in a SQLite database with one row per exported file.
+"""
+import os
+import json
+import sqlite3
+import pandas as pd
+from trodes.read_exported import parse_fields, read_trodes_extracted_data_header
+
+# Name of the table in the SQLite database
+CATALOG_TABLE = "trodes_files"
+# Columns of the catalog and their SQLite types
+CATALOG_COLUMNS = {
+    "source_path": "TEXT PRIMARY KEY",
+    "file_name": "TEXT",
+    "export_dir": "TEXT",
+    "prefix": "TEXT",
+    "suffix": "TEXT",
+    "file_key": "TEXT",
+    "file_size": "INTEGER",
+    "file_mtime_ns": "INTEGER",
+    "header_size": "INTEGER",
+    "fields": "TEXT",
+    "dtype": "TEXT",
+    "record_size": "INTEGER",
+    "sample_count": "INTEGER",
+    "clockrate": "INTEGER",
+    "first_timestamp": "INTEGER",
+    "ntrode_id": "TEXT",
+    "ntrode_channel": "TEXT",
+    "voltage_scaling": "REAL",
+    "settings": "TEXT",
+}
+
+def _to_number(value, number_type=int):
+    """
+    Converts a setting from the header into a number, or None if it is missing or not a number.
+    """
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        return None
+
+def get_trodes_file_catalog_row(file_path):
+    """
+    Reads the settings block of a Trodes extracted data file and summarizes it as a row of the catalog.
+
+    Args:
+        file_path (str): The path to the Trodes file.
+
+    Returns:
+        dict: With the keys of `CATALOG_COLUMNS`.
+            - 'sample_count' is the number of complete records after the settings block
+            - 'settings' is all the settings of the header as JSON
+    """
+    source_path = os.path.abspath(file_path)
+    file_stat = os.stat(source_path)
+    header = read_trodes_extracted_data_header(source_path)
+    header_size = header.pop("header_size")
+    header.pop("filename")
+    dt = parse_fields(header["fields"])
+
+    # The subdirectory is named like "recording.LFP" and the file like "recording.LFP_nt1ch1.dat"
+    sub_dir_name = os.path.basename(os.path.dirname(source_path))
+    sub_dir_name_parts = sub_dir_name.split('.')
+    file_name = os.path.basename(source_path)
+
+    return {
+        "source_path": source_path,
+        "file_name": file_name,
+        "export_dir": os.path.dirname(os.path.dirname(source_path)),
+        "prefix": sub_dir_name_parts[0],
+        "suffix": sub_dir_name_parts[-1],
+        "file_key": file_name.rsplit('.', 2)[-2],
+        "file_size": file_stat.st_size,
+        "file_mtime_ns": file_stat.st_mtime_ns,
+        "header_size": header_size,
+        "fields": header["fields"],
+        "dtype": str(dt.descr),
+        "record_size": dt.itemsize,
+        "sample_count": (file_stat.st_size - header_size) // dt.itemsize,
+        "clockrate": _to_number(header.get("clockrate")),
+        "first_timestamp": _to_number(header.get("first_timestamp")),
+        "ntrode_id": header.get("ntrode_id"),
+        "ntrode_channel": header.get("ntrode_channel"),
+        "voltage_scaling": _to_number(header.get("voltage_scaling"), float),
+        "settings": json.dumps(header),
+    }
+
+def _find_trodes_files(dir_path, extension=".dat"):
+    """
+    Yields the path of every file with the extension in a directory and all of its subdirectories, in sorted order.
+    """
+    for root, dir_names, file_names in os.walk(dir_path):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(extension):
+                yield os.path.join(root, file_name)
+
+def scan_trodes_export_headers(dir_path, extension=".dat"):
+    """
+    Finds every Trodes extracted data file in a directory and all of its subdirectories and reads their headers.
+
+    Args:
+        dir_path (str): Path of the directory to search.
+        extension (str): Extension of the Trodes extracted data files.
+
+    Returns:
+        list: Rows from `get_trodes_file_catalog_row`, sorted by path.
+        list: Error report with a dictionary for every file that could not be read.
+            Each dictionary has the 'path', 'error_type' and 'error' keys.
+    """
+    rows = []
+    errors = []
+    for file_path in _find_trodes_files(dir_path, extension=extension):
+        try:
+            rows.append(get_trodes_file_catalog_row(file_path))
+        except Exception as e:
+            errors.append({"path": file_path, "error_type": type(e).__name__, "error": str(e)})
+    return rows, errors
+
+def _create_catalog_table(connection):
+    """
+    Creates the catalog table if it doesn't exist yet.
+    """
+    column_definitions = ", ".join(f"{column} {column_type}" for column, column_type in CATALOG_COLUMNS.items())
+    connection.execute(f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} ({column_definitions})")
+
+def update_trodes_catalog(catalog_path, dir_paths, extension=".dat"):
+    """
+    Adds the headers of all the Trodes extracted data files in the directories to a SQLite catalog.
+    Files that are already in the catalog with the same size and modification time are not read again.
+    Files that are in the catalog, but no longer exist under the directories are left in the catalog.
+
+    Args:
+        catalog_path (str): Path of the SQLite database. It is created if it doesn't exist.
+        dir_paths (str or list): Directories to search for Trodes files, including all of their subdirectories.
+        extension (str): Extension of the Trodes extracted data files.
+
+    Returns:
+        int: The number of rows that were added or updated.
+        list: Error report with a dictionary for every file that could not be read.
+            Each dictionary has the 'path', 'error_type' and 'error' keys.
+    """
+    if isinstance(dir_paths, str):
+        dir_paths = [dir_paths]
+
+    connection = sqlite3.connect(catalog_path)
+    try:
+        _create_catalog_table(connection)
+        # Size and modification time of everything that is already in the catalog
+        path_to_stat = {path: (size, mtime) for path, size, mtime in
+            connection.execute(f"SELECT source_path, file_size, file_mtime_ns FROM {CATALOG_TABLE}")}
+
+        rows = []
+        errors = []
+        for dir_path in dir_paths:
+            for file_path in _find_trodes_files(dir_path, extension=extension):
+                file_path = os.path.abspath(file_path)
+                try:
+                    file_stat = os.stat(file_path)
+                    # Skipping the files that have not changed since they were cataloged
+                    if path_to_stat.get(file_path) == (file_stat.st_size, file_stat.st_mtime_ns):
+                        continue
+                    rows.append(get_trodes_file_catalog_row(file_path))
+                except Exception as e:
+                    errors.append({"path": file_path, "error_type": type(e).__name__, "error": str(e)})
+
+        columns = list(CATALOG_COLUMNS)
+        placeholders = ", ".join("?" for _ in columns)
+        with connection:
+            connection.executemany(f"INSERT OR REPLACE INTO {CATALOG_TABLE} ({', '.join(columns)}) VALUES ({placeholders})",
+                [tuple(row[column] for column in columns) for row in rows])
+    finally:
+        connection.close()
+    return len(rows), errors
+
+def read_trodes_catalog(catalog_path):
+    """
+    Reads the whole catalog into a DataFrame.
+
+    Args:
+        catalog_path (str): Path of the SQLite database created by `update_trodes_catalog`.
+
+    Returns:
+        Pandas DataFrame: One row per Trodes extracted data file, sorted by path.
+    """
+    connection = sqlite3.connect(catalog_path)
+    try:
+        return pd.read_sql_query(f"SELECT * FROM {CATALOG_TABLE} ORDER BY source_path", connection)
+    finally:
+        connection.close()
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()
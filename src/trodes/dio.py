@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Functions for turning the DIO files exported by Trodes into onset and offset intervals.
+
+Each DIO file has a record for the starting state and for every time that the state changes, with the fields "time" and "state".
+All the channels of a session are combined and processed together with array operations, without looping over the records.
+"""
+import numpy as np
+import pandas as pd
+
+def get_dio_intervals(times, states, channels, debounce=0, min_duration=0, active_state=1, final_time=None):
+    """
+    Finds the intervals that every DIO channel is in the active state.
+
+    Args:
+        times (numpy.ndarray): Timestamp of every record of every channel.
+        states (numpy.ndarray): State of every record, with the same length as the times.
+        channels (numpy.ndarray): Name of the channel of every record, with the same length as the times.
+        debounce (int): Intervals of the same channel that are separated by less than this many timestamps are merged.
+        min_duration (int): Intervals that are shorter than this many timestamps are removed. This is applied after merging.
+        active_state (int): The state that counts as being on. i.e. 0 for a beam break that is active low.
+        final_time (int, optional): The offset of intervals that are still active at the last record.
+            Defaults to the last timestamp of all the channels.
+
+    Returns:
+        Pandas DataFrame: One row per interval, sorted by channel and onset, with the columns:
+            - channel: Categorical of the channel name
+            - onset: Timestamp that the channel became active
+            - offset: Timestamp that the channel became inactive
+            - duration: Number of timestamps between the onset and the offset
+            - closed: False for intervals that were still active at the last record, and got `final_time` as the offset
+    """
+    times = np.asarray(times, dtype=np.int64).reshape(-1)
+    states = np.asarray(states).reshape(-1)
+    channel_categories = pd.Categorical(np.asarray(channels).reshape(-1))
+    channel_codes = channel_categories.codes.astype(np.int64)
+    if final_time is None:
+        final_time = times.max() if len(times) else 0
+
+    # Sorting by channel, and then by time within each channel
+    order = np.lexsort((times, channel_codes))
+    times, channel_codes = times[order], channel_codes[order]
+    is_active = states[order] == active_state
+
+    # Comparing every record to the previous record of the same channel, the first record of a channel starts inactive
+    is_first_of_channel = np.ones(len(times), dtype=bool)
+    is_first_of_channel[1:] = channel_codes[1:] != channel_codes[:-1]
+    was_active = np.zeros(len(times), dtype=bool)
+    was_active[1:] = is_active[:-1]
+    was_active[is_first_of_channel] = False
+
+    # Only the records where the state changes, which alternate between onsets and offsets within a channel
+    transition_indices = np.flatnonzero(is_active != was_active)
+    transition_is_onset = is_active[transition_indices]
+    onset_positions = np.flatnonzero(transition_is_onset)
+
+    # The transition after an onset is its offset, unless it is in another channel or there isn't one
+    next_positions = onset_positions + 1
+    has_offset = next_positions < len(transition_indices)
+    has_offset[has_offset] = channel_codes[transition_indices[next_positions[has_offset]]] == channel_codes[transition_indices[onset_positions[has_offset]]]
+
+    onset_indices = transition_indices[onset_positions]
+    onsets = times[onset_indices]
+    interval_channels = channel_codes[onset_indices]
+    offsets = np.full(len(onsets), final_time, dtype=np.int64)
+    offsets[has_offset] = times[transition_indices[next_positions[has_offset]]]
+
+    # Merging intervals of the same channel that are closer than the debounce
+    if debounce > 0 and len(onsets):
+        starts_group = np.ones(len(onsets), dtype=bool)
+        starts_group[1:] = (interval_channels[1:] != interval_channels[:-1]) | (onsets[1:] - offsets[:-1] >= debounce)
+        group_starts = np.flatnonzero(starts_group)
+        group_ends = np.append(group_starts[1:], len(onsets)) - 1
+        onsets, offsets = onsets[group_starts], offsets[group_ends]
+        interval_channels, has_offset = interval_channels[group_starts], has_offset[group_ends]
+
+    durations = offsets - onsets
+    keep = durations >= min_duration
+    return pd.DataFrame({
+        "channel": pd.Categorical.from_codes(interval_channels[keep], categories=channel_categories.categories),
+        "onset": onsets[keep],
+        "offset": offsets[keep],
+        "duration": durations[keep],
+        "closed": has_offset[keep],
+    })
+
+def get_session_dio_intervals(channel_to_dio, **kwargs):
+    """
+    Finds the intervals that every DIO channel of a session is active.
+    The records of all the channels are combined, so that they are processed in one pass by `get_dio_intervals`.
+
+    Args:
+        channel_to_dio (dict): Channel name to either the DIO records, or the dictionary from `read_trodes_extracted_data_file`.
+            i.e. the output of `organize_single_trodes_export` for the DIO subdirectory, or a `trodes.export.TrodesStream`.
+        **kwargs: Other arguments for `get_dio_intervals`, like `debounce` and `min_duration`.
+
+    Returns:
+        Pandas DataFrame: One row per interval. See `get_dio_intervals`.
+    """
+    all_times, all_states, all_channels = [], [], []
+    for channel, dio in channel_to_dio.items():
+        data = dio["data"] if isinstance(dio, dict) else dio
+        all_times.append(np.asarray(data["time"]).reshape(len(data), -1)[:, 0])
+        all_states.append(np.asarray(data["state"]).reshape(len(data), -1)[:, 0])
+        all_channels.append(np.full(len(data), channel, dtype=object))
+
+    if not all_times:
+        return get_dio_intervals(np.zeros(0), np.zeros(0), np.zeros(0, dtype=object), **kwargs)
+    return get_dio_intervals(np.concatenate(all_times), np.concatenate(all_states), np.concatenate(all_channels), **kwargs)
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Lazy access to the directories created by exporting a Trodes recording.
+
+Unlike `organize_all_trodes_export`, building these objects only reads the settings block of every file.
+The data of each file is read the first time it is accessed, and can be released again afterwards.
+"""
+import os
+from collections.abc import Mapping
+from trodes.read_exported import read_trodes_extracted_data_header, read_trodes_extracted_data_file
+
+class TrodesStream(Mapping):
+    """
+    All the Trodes extracted data files in one exported subdirectory (i.e. "recording.LFP").
+
+    The keys are the same as the ones from `organize_single_trodes_export`, the penultimate part of the file name.
+    Accessing a key reads that file with `read_trodes_extracted_data_file` and keeps the result until `release` is called.
+
+    Args:
+        dir_path (str): The path to the directory containing the Trodes files.
+        mmap (bool): To memory map the data of each file instead of loading it. See `read_trodes_extracted_data_file`.
+    """
+    def __init__(self, dir_path, mmap=False):
+        self.dir_path = dir_path
+        self.mmap = mmap
+        # Settings of every file, these are the only things read when the stream is created
+        self.headers = {}
+        # Path of every file, with the same keys as the headers
+        self.file_paths = {}
+        # Cache of the files that have been read
+        self._loaded = {}
+
+        for file_name in sorted(os.listdir(dir_path)):
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                # Extract second to last part of the file name
+                key = file_name.rsplit('.', 2)[-2]
+                self.headers[key] = read_trodes_extracted_data_header(file_path)
+                self.file_paths[key] = file_path
+            # Skip files that cause errors during parsing
+            except Exception as e:
+                print(f"Skipping file {file_name} due to error: {e}")
+                continue
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            self._loaded[key] = read_trodes_extracted_data_file(self.file_paths[key], mmap=self.mmap)
+        return self._loaded[key]
+
+    def __iter__(self):
+        return iter(self.headers)
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.dir_path!r}, loaded={len(self._loaded)}/{len(self)})"
+
+    @property
+    def loaded_keys(self):
+        """
+        list: The keys of the files that are currently loaded.
+        """
+        return list(self._loaded)
+
+    def load(self, keys=None):
+        """
+        Reads the data of the files that have not been read yet.
+
+        Args:
+            keys (list, optional): Keys of the files to read. Defaults to all the files.
+
+        Returns:
+            dict: The same dictionary that `organize_single_trodes_export` would return for the keys.
+        """
+        if keys is None:
+            keys = list(self)
+        return {key: self[key] for key in keys}
+
+    def release(self, keys=None):
+        """
+        Drops the data of loaded files so that the memory can be freed. The headers are kept.
+
+        Args:
+            keys (list, optional): Keys of the files to release. Defaults to all the files.
+        """
+        if keys is None:
+            keys = list(self._loaded)
+        for key in keys:
+            self._loaded.pop(key, None)
+
+class TrodesExport(Mapping):
+    """
+    All the exported subdirectories of a Trodes recording.
+    This mirrors the nested dictionary from `organize_all_trodes_export`, with the subdirectory prefix and suffix as keys,
+    but each subdirectory is a `TrodesStream` that only reads data when it is accessed.
+
+    i.e. `TrodesExport(dir_path)["recording"]["LFP"]["LFP_nt1ch1"]["data"]` or `TrodesExport(dir_path).lfp["LFP_nt1ch1"]["data"]`
+
+    Args:
+        dir_path (str): Path of the directory with the exported subdirectories.
+        mmap (bool): To memory map the data of each file instead of loading it. See `read_trodes_extracted_data_file`.
+    """
+    # The subdirectory suffixes that Trodes uses for each stream, in the order that they are looked up
+    STREAM_SUFFIXES = {
+        "lfp": ("LFP",),
+        "dio": ("DIO",),
+        "spikeband": ("spikeband",),
+        "analog": ("analog",),
+        "timestamps": ("timestamps", "time"),
+    }
+
+    def __init__(self, dir_path, mmap=False):
+        self.dir_path = dir_path
+        self.mmap = mmap
+        self.streams = {}
+
+        for sub_dir_name in sorted(os.listdir(dir_path)):
+            # Construct the full path to the subdirectory
+            sub_dir_path = os.path.join(dir_path, sub_dir_name)
+            # Process only if it's a directory
+            if os.path.isdir(sub_dir_path):
+                try:
+                    # Split the subdirectory name by dots to extract prefix and suffix
+                    sub_dir_name_parts = sub_dir_name.split('.')
+                    sub_dir_name_prefix = sub_dir_name_parts[0]
+                    sub_dir_name_suffix = sub_dir_name_parts[-1]
+                    self.streams.setdefault(sub_dir_name_prefix, {})[sub_dir_name_suffix] = TrodesStream(sub_dir_path, mmap=mmap)
+                except Exception as e:
+                    print(f"Error processing subdirectory {sub_dir_path}: {e}")
+                    continue
+
+    def __getitem__(self, prefix):
+        return self.streams[prefix]
+
+    def __iter__(self):
+        return iter(self.streams)
+
+    def __len__(self):
+        return len(self.streams)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.dir_path!r}, prefixes={list(self.streams)})"
+
+    def get_stream(self, suffix, prefix=None):
+        """
+        Gets the `TrodesStream` of a subdirectory. The suffix is matched without case.
+
+        Args:
+            suffix (str or tuple): Suffix of the subdirectory (i.e. "LFP"). A tuple of suffixes will return the first one that exists.
+            prefix (str, optional): Prefix of the subdirectory. Can be left out when the export only has one prefix.
+
+        Returns:
+            TrodesStream: The stream for the subdirectory.
+
+        Raises:
+            ValueError: If the prefix is ambiguous.
+            KeyError: If there is no subdirectory with the suffix.
+        """
+        if prefix is None:
+            if len(self.streams) != 1:
+                raise ValueError(f"Prefix must be given when there is not exactly one, found: {list(self.streams)}")
+            prefix = next(iter(self.streams))
+        if isinstance(suffix, str):
+            suffix = (suffix,)
+
+        lower_suffix_to_stream = {key.lower(): value for key, value in self.streams[prefix].items()}
+        for current_suffix in suffix:
+            if current_suffix.lower() in lower_suffix_to_stream:
+                return lower_suffix_to_stream[current_suffix.lower()]
+        raise KeyError(f"No subdirectory with suffix {suffix} for {prefix} in {self.dir_path}")
+
+    @property
+    def lfp(self):
+        return self.get_stream(self.STREAM_SUFFIXES["lfp"])
+
+    @property
+    def dio(self):
+        return self.get_stream(self.STREAM_SUFFIXES["dio"])
+
+    @property
+    def spikeband(self):
+        return self.get_stream(self.STREAM_SUFFIXES["spikeband"])
+
+    @property
+    def analog(self):
+        return self.get_stream(self.STREAM_SUFFIXES["analog"])
+
+    @property
+    def timestamps(self):
+        return self.get_stream(self.STREAM_SUFFIXES["timestamps"])
+
+    def release(self):
+        """
+        Drops the data of every loaded file in every stream. The headers are kept.
+        """
+        for suffix_to_stream in self.streams.values():
+            for stream in suffix_to_stream.values():
+                stream.release()
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()
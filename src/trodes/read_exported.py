@@ -5,6 +5,7 @@ import os
 import warnings
 import re
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import pathlib
 import numpy as np
 
@@ -61,22 +62,20 @@ def parse_fields(field_str):
     
     return np.dtype(dtype_spec)
 
-def read_trodes_extracted_data_file(filename):
+def read_trodes_extracted_data_header(filename):
     """
-    Reads the content of a Trodes extracted data file.
+    Reads only the settings block of a Trodes extracted data file.
 
-    This function opens a Trodes file, reads the settings, parses them into a dictionary, 
-    and then reads the remaining data in the file as a numpy array according to the 
-    data types specified in the settings. If the settings block does not start correctly,
-    it raises an Exception.
+    The settings are parsed into a dictionary in the same way as `read_trodes_extracted_data_file`,
+    but the binary data after the settings block is never read. The number of bytes taken up by the 
+    settings block is stored under the 'header_size' key, which is the byte offset of the first record.
 
     Args:
         filename (str): The path to the Trodes file to be read.
 
     Returns:
         dict: A dictionary where keys are settings field names and values are the 
-              corresponding setting values. The actual data from the file is stored 
-              under the 'data' key as a numpy array.
+              corresponding setting values. Also includes the 'header_size' and 'filename' keys.
 
     Raises:
         Exception: If the settings block in the file does not start with '<Start settings>'.
@@ -86,36 +85,178 @@ def read_trodes_extracted_data_file(filename):
         if f.readline().decode('ascii').strip() != '<Start settings>':
             raise Exception("Settings format not supported")
         
-        # Flag indicating we're reading the settings block
-        fields = True
         # Dictionary to hold the settings fields and values
         fields_text = {}
         
-        # Iterate over the lines in the file
-        for line in f:
-            # If we're still reading the settings block
-            if fields:
-                line = line.decode('ascii').strip()
-                # If we've not reached the end of the settings block, continue reading fields
-                if line != '<End settings>':
-                    key, value = line.split(': ')
-                    fields_text.update({key.lower(): value})
-                # If we've reached the end of the settings block, stop reading fields
-                else:
-                    fields = False
-                    # Parse the 'fields' setting to get the data type
-                    dt = parse_fields(fields_text['fields'])
-                    fields_text['data'] = np.zeros([1], dtype = dt)
-                    break
+        # Reading line by line so that the file position ends right after the settings block
+        for line in iter(f.readline, b''):
+            line = line.decode('ascii').strip()
+            # If we've reached the end of the settings block, stop reading fields
+            if line == '<End settings>':
+                break
+            key, value = line.split(': ')
+            fields_text.update({key.lower(): value})
         
-        # Read the remaining data from the file using the parsed data type
-        dt = parse_fields(fields_text['fields'])
-        data = np.fromfile(f, dt)
-        fields_text.update({'data': data})
+        fields_text.update({'header_size': f.tell()})
         fields_text.update({'filename': os.path.basename(filename)})
         return fields_text
+
+def select_trodes_channels(traces, channels):
+    """
+    Selects channels from a 2D array of traces with one column per channel.
+    Evenly spaced channels are selected with a slice, so a memory mapped array stays a memory map 
+    and nothing is read until the traces are used. Other channel lists make a copy of only those channels.
+
+    Args:
+        traces (numpy.ndarray): 2D array of traces with the shape (samples, channels).
+        channels (list or dict): Either a list of column indices, or a dictionary of names (i.e. brain regions) to column indices.
+
+    Returns:
+        numpy.ndarray or dict: A 2D array of the selected channels in the same order as the list,
+            or a dictionary of the names to a 1D array of the trace of that channel. An empty list gives an array with no columns.
+
+    Raises:
+        IndexError: If a channel in the list is not a column of the traces. Negative indices count from the last column.
+    """
+    if isinstance(channels, dict):
+        # Selecting a single column is always a view
+        return {name: traces[:, int(channel)] for name, channel in channels.items()}
+
+    channels = np.asarray(channels, dtype=int).reshape(-1)
+    if len(channels) == 0:
+        return traces[:, :0]
+    num_columns = traces.shape[1]
+    if np.any((channels < -num_columns) | (channels >= num_columns)):
+        raise IndexError(f"Channels {channels.tolist()} are out of range for traces with {num_columns} channels")
+    # Negative indices are made positive, so that they work with the slices below
+    channels = channels % num_columns
+    if len(channels) == 1:
+        return traces[:, channels[0]:channels[0] + 1]
+    step = channels[1] - channels[0]
+    # Evenly spaced increasing channels can be a strided view
+    if step > 0 and np.all(np.diff(channels) == step):
+        return traces[:, channels[0]:channels[-1] + 1:step]
+    return traces[:, channels]
+
+def read_trodes_extracted_data_file(filename, mmap=False, channels=None, field='voltage'):
+    """
+    Reads the content of a Trodes extracted data file.
+
+    This function opens a Trodes file, reads the settings, parses them into a dictionary, 
+    and then reads the remaining data in the file as a numpy array according to the 
+    data types specified in the settings. If the settings block does not start correctly,
+    it raises an Exception.
+
+    With `mmap`, the data is not copied into memory. Instead a read-only `np.memmap` of the 
+    structured data type is created at the byte offset where the settings block ends.
+    Only the parts of the file that are sliced are read from disk.
+
+    With `channels`, only those channels of a multi-channel field (i.e. '<voltage 32*int16>') are kept, 
+    see `select_trodes_channels`. Without `mmap`, only the selected channels are copied into memory.
+
+    Args:
+        filename (str): The path to the Trodes file to be read.
+        mmap (bool): To return the data as a read-only memory map instead of loading it into memory.
+        channels (list or dict, optional): The channel indices of `field` to keep, 
+            or a dictionary of names (i.e. brain regions) to channel indices.
+        field (str): The name of the multi-channel field to select the channels from.
+
+    Returns:
+        dict: A dictionary where keys are settings field names and values are the 
+              corresponding setting values. The actual data from the file is stored 
+              under the 'data' key as a numpy array (or `np.memmap` if `mmap` is True).
+              With `channels`, the 'data' is a 2D array of the selected channels with the shape (samples, channels),
+              or a dictionary of names to the trace of each channel.
+
+    Raises:
+        Exception: If the settings block in the file does not start with '<Start settings>'.
+    """
+    fields_text = read_trodes_extracted_data_header(filename)
+    header_size = fields_text.pop('header_size')
+    
+    # Parse the 'fields' setting to get the data type
+    dt = parse_fields(fields_text['fields'])
+    if mmap or channels is not None:
+        # Only complete records are mapped, np.memmap can not map an empty region
+        num_records = (os.path.getsize(filename) - header_size) // dt.itemsize
+        if num_records > 0:
+            data = np.memmap(filename, dtype=dt, mode='r', offset=header_size, shape=(num_records,))
+        else:
+            data = np.zeros([0], dtype=dt)
+    else:
+        # Read the remaining data from the file using the parsed data type
+        with open(filename, 'rb') as f:
+            f.seek(header_size)
+            data = np.fromfile(f, dt)
+
+    if channels is not None:
+        # The number of channels comes from the data type, so that a file without any records gives (0, channels)
+        traces = data[field].reshape(len(data), int(np.prod(dt[field].shape)))
+        data = select_trodes_channels(traces, channels)
+        # Copying the selected channels out of the memory map
+        if not mmap:
+            data = {name: np.array(trace) for name, trace in data.items()} if isinstance(data, dict) else np.array(data)
+    fields_text.update({'data': data})
+    return fields_text
     
-def organize_single_trodes_export(dir_path, skip_raw_group0=True):
+def iterate_trodes_extracted_data_file(filename, chunk_size=1000000, overlap=0, timestamps=None):
+    """
+    Reads a Trodes extracted data file in blocks of a fixed number of records, so that only one block is in memory at a time.
+    Consecutive blocks can overlap by a number of records, i.e. for filters that need some samples of the previous block.
+
+    The timestamp range of each block comes from the 'time' field when the file has one (i.e. DIO and timestamps files).
+    Files without it (i.e. LFP files) need the matching timestamps from the `timestamps` argument.
+
+    Args:
+        filename (str): The path to the Trodes file to be read.
+        chunk_size (int): The number of records in each block. The last block can be smaller.
+        overlap (int): The number of records that each block shares with the previous block.
+        timestamps (str or numpy.ndarray, optional): The timestamps for each record of the file.
+            Either the path to a Trodes timestamps file or an array. Not needed if the file has a 'time' field.
+
+    Yields:
+        dict: With the keys:
+            - 'start_index': Index of the first record of the block
+            - 'stop_index': Index after the last record of the block
+            - 'data': Numpy array of the records in the block
+            - 'first_timestamp': Timestamp of the first record of the block, or None if there are no timestamps
+            - 'last_timestamp': Timestamp of the last record of the block, or None if there are no timestamps
+
+    Raises:
+        ValueError: If the overlap is not smaller than the chunk size.
+    """
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise ValueError(f"Overlap ({overlap}) must be at least 0 and smaller than the chunk size ({chunk_size})")
+
+    fields_text = read_trodes_extracted_data_header(filename)
+    dt = parse_fields(fields_text['fields'])
+    num_records = (os.path.getsize(filename) - fields_text['header_size']) // dt.itemsize
+
+    # Memory mapping the timestamps so that they are also only read one block at a time
+    if isinstance(timestamps, (str, os.PathLike)):
+        timestamps = read_trodes_extracted_data_file(timestamps, mmap=True)['data']['time']
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps).reshape(len(timestamps), -1)[:, 0]
+
+    step = chunk_size - overlap
+    with open(filename, 'rb') as f:
+        for start_index in range(0, max(num_records - overlap, min(num_records, 1)), step):
+            stop_index = min(start_index + chunk_size, num_records)
+            f.seek(fields_text['header_size'] + start_index * dt.itemsize)
+            data = np.fromfile(f, dt, count=stop_index - start_index)
+
+            # Getting the timestamps of the first and last record of the block
+            first_timestamp = last_timestamp = None
+            if len(data) and dt.names and 'time' in dt.names:
+                block_timestamps = data['time'].reshape(len(data), -1)[:, 0]
+                first_timestamp, last_timestamp = int(block_timestamps[0]), int(block_timestamps[-1])
+            elif len(data) and timestamps is not None:
+                first_timestamp, last_timestamp = int(timestamps[start_index]), int(timestamps[stop_index - 1])
+
+            yield {'start_index': start_index, 'stop_index': stop_index, 'data': data,
+                'first_timestamp': first_timestamp, 'last_timestamp': last_timestamp}
+
+def organize_single_trodes_export(dir_path, skip_raw_group0=True, mmap=False):
     """
     Organizes Trodes data files in a given directory. The data is stored in a dictionary. 
     The key is the penultimate (second to last) part of the file name (i.e., the part before the last dot in the file name). 
@@ -124,6 +265,7 @@ def organize_single_trodes_export(dir_path, skip_raw_group0=True):
     Args:
         dir_path (str): The path to the directory containing the Trodes files.
         skip_raw_group0(bool): To skip the "raw_group0" file which contains the raw signal which uses a lot of memory
+        mmap(bool): To memory map the data of each file instead of loading it. See `read_trodes_extracted_data_file`.
     Returns:
         dict: A dictionary with organized Trodes file data.
     """
@@ -140,7 +282,7 @@ def organize_single_trodes_export(dir_path, skip_raw_group0=True):
             # Extract second to last part of the file name
             sub_dir_name = file_name.rsplit('.', 2)[-2]
             # Parse Trodes file and store the data
-            result[sub_dir_name] = read_trodes_extracted_data_file(os.path.join(dir_path, file_name))
+            result[sub_dir_name] = read_trodes_extracted_data_file(os.path.join(dir_path, file_name), mmap=mmap)
 
         # Skip files that cause errors during parsing
         except Exception as e:
@@ -149,7 +291,47 @@ def organize_single_trodes_export(dir_path, skip_raw_group0=True):
 
     return result
 
-def organize_all_trodes_export(dir_path):
+def read_trodes_lfp_channels(dir_path, channels, mmap=True):
+    """
+    Reads the LFP traces of some nTrodes from an exported LFP directory (i.e. "recording.LFP").
+    Trodes exports one file per nTrode, so only the files of the requested nTrodes are read. 
+    The files are matched with the 'ntrode_id' setting in their headers.
+
+    Args:
+        dir_path (str): The path to the exported LFP directory.
+        channels (list or dict): Either a list of nTrode IDs, or a dictionary of names (i.e. brain regions) to nTrode IDs.
+        mmap (bool): To memory map the files instead of loading them. 
+            Only has an effect with a dictionary, because a list of channels is always combined into a new array.
+
+    Returns:
+        numpy.ndarray or dict: A 2D array of the LFP traces with the shape (samples, channels) in the same order as the list,
+            or a dictionary of the names to the LFP trace of that nTrode.
+
+    Raises:
+        KeyError: If there is no file for one of the nTrode IDs.
+    """
+    # Finding the file of every nTrode from just the headers
+    ntrode_id_to_path = {}
+    for file_name in sorted(os.listdir(dir_path)):
+        file_path = os.path.join(dir_path, file_name)
+        try:
+            header = read_trodes_extracted_data_header(file_path)
+        except Exception:
+            continue
+        if "ntrode_id" in header:
+            ntrode_id_to_path.setdefault(header["ntrode_id"], file_path)
+
+    def read_trace(ntrode_id):
+        if str(ntrode_id) not in ntrode_id_to_path:
+            raise KeyError(f"No LFP file for nTrode {ntrode_id} in {dir_path}")
+        data = read_trodes_extracted_data_file(ntrode_id_to_path[str(ntrode_id)], mmap=mmap)['data']
+        return data['voltage'].reshape(len(data), -1)[:, 0]
+
+    if isinstance(channels, dict):
+        return {name: read_trace(ntrode_id) for name, ntrode_id in channels.items()}
+    return np.column_stack([read_trace(ntrode_id) for ntrode_id in channels])
+
+def organize_all_trodes_export(dir_path, skip_raw_group0=True, mmap=False):
     """
     Organize Trodes files in subdirectories based on prefix and suffix of the subdirectory.
     The function creates a dictionary with subdirectory prefix and suffix as keys,
@@ -157,6 +339,8 @@ def organize_all_trodes_export(dir_path):
 
     Args:
         dir_path (str): Path of the directory to process.
+        skip_raw_group0(bool): To skip the "raw_group0" file which contains the raw signal which uses a lot of memory
+        mmap(bool): To memory map the data of each file instead of loading it. See `read_trodes_extracted_data_file`.
 
     Returns:
         dict: Nested dictionary with keys as subdirectory prefix and suffix and values 
@@ -175,7 +359,7 @@ def organize_all_trodes_export(dir_path):
                 sub_dir_name_prefix = sub_dir_name_parts[0]
                 sub_dir_name_suffix = sub_dir_name_parts[-1]
                 # Organize the Trodes files in the subdirectory and store the results
-                result[sub_dir_name_prefix][sub_dir_name_suffix] = organize_single_trodes_export(sub_dir_path)
+                result[sub_dir_name_prefix][sub_dir_name_suffix] = organize_single_trodes_export(sub_dir_path, skip_raw_group0=skip_raw_group0, mmap=mmap)
             except Exception as e:
                 print(f"Error processing subdirectory {sub_dir_path}: {e}")
                 continue
@@ -188,6 +372,68 @@ def organize_all_trodes_export(dir_path):
 
 
 
+def organize_all_trodes_export_parallel(dir_path, max_workers=None, use_processes=False, skip_raw_group0=True, mmap=False):
+    """
+    Parallel version of `organize_all_trodes_export`. 
+    All the files in all the subdirectories are read with a pool of workers instead of one at a time.
+    The subdirectories and files are processed in sorted order, so the output is the same every run.
+    Files that can not be read are collected into an error report instead of being printed.
+
+    Threads are used by default because reading the files is mostly I/O, which releases the GIL.
+    With `use_processes`, the data is pickled back to the main process, so `mmap` is not useful with it.
+
+    Args:
+        dir_path (str): Path of the directory to process.
+        max_workers (int, optional): Number of workers in the pool. Defaults to the default of the executor.
+        use_processes (bool): To use a pool of processes instead of threads.
+        skip_raw_group0(bool): To skip the "raw_group0" file which contains the raw signal which uses a lot of memory
+        mmap(bool): To memory map the data of each file instead of loading it. See `read_trodes_extracted_data_file`.
+
+    Returns:
+        dict: Nested dictionary with keys as subdirectory prefix and suffix and values 
+        containing data obtained from the `organize_single_trodes_export` function.
+        list: Error report with a dictionary for every file or subdirectory that could not be read.
+            Each dictionary has the 'path', 'error_type' and 'error' keys.
+    """
+    result = defaultdict(dict)
+    errors = []
+
+    # Finding all the files first so that the reading can be spread over the workers
+    tasks = []
+    for sub_dir_name in sorted(os.listdir(dir_path)):
+        sub_dir_path = os.path.join(dir_path, sub_dir_name)
+        if not os.path.isdir(sub_dir_path):
+            continue
+        # Split the subdirectory name by dots to extract prefix and suffix
+        sub_dir_name_parts = sub_dir_name.split('.')
+        sub_dir_name_prefix = sub_dir_name_parts[0]
+        sub_dir_name_suffix = sub_dir_name_parts[-1]
+        result[sub_dir_name_prefix][sub_dir_name_suffix] = {}
+        try:
+            file_names = sorted(os.listdir(sub_dir_path))
+        except Exception as e:
+            errors.append({"path": sub_dir_path, "error_type": type(e).__name__, "error": str(e)})
+            continue
+        for file_name in file_names:
+            if skip_raw_group0 and "raw_group0" in file_name:
+                continue
+            # Extract second to last part of the file name
+            file_key = file_name.rsplit('.', 2)[-2]
+            tasks.append((sub_dir_name_prefix, sub_dir_name_suffix, file_key, os.path.join(sub_dir_path, file_name)))
+
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        futures = [executor.submit(read_trodes_extracted_data_file, file_path, mmap) for _, _, _, file_path in tasks]
+        # Collecting in the order of the tasks so that the output order does not depend on which worker finished first
+        for (prefix, suffix, file_key, file_path), future in zip(tasks, futures):
+            try:
+                result[prefix][suffix][file_key] = future.result()
+            except Exception as e:
+                errors.append({"path": file_path, "error_type": type(e).__name__, "error": str(e)})
+
+    return result, errors
+
+
 ##########################
 ##########################
 ##########################
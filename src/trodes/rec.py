@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Reader for SpikeGadgets .rec files without exporting them with Trodes first.
+
+A .rec file is an XML configuration followed by fixed size packets. Every packet has:
+    - A sync byte
+    - The bytes of every device (i.e. "ECU", "Controller_DIO") in the order of the hardware configuration
+    - A uint32 timestamp
+    - An int64 system time, only if "sysTimeIncluded" is set in the hardware configuration
+    - An int16 sample for every neural channel, ordered by hardware channel (see `get_rec_hardware_channels_in_packet_order`)
+The configuration is parsed once, and then the packets are memory mapped with a structured data type.
+So the traces, DIO bytes and timestamps are views into the file that are only read when they are used.
+"""
+import os
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+from trodes.read_exported import select_trodes_channels
+
+def read_rec_header(filename):
+    """
+    Reads the XML configuration at the start of a .rec file.
+
+    Args:
+        filename (str): The path to the .rec file.
+
+    Returns:
+        xml.etree.ElementTree.Element: The root "Configuration" element.
+        int: The number of bytes taken up by the configuration, which is the byte offset of the first packet.
+
+    Raises:
+        ValueError: If the end of the configuration can not be found.
+    """
+    with open(filename, "rb") as f:
+        for line in iter(f.readline, b""):
+            if b"</Configuration>" in line:
+                header_size = f.tell()
+                break
+        else:
+            raise ValueError(f"No </Configuration> found in {filename}")
+        f.seek(0)
+        header_text = f.read(header_size)
+    return ElementTree.fromstring(header_text), header_size
+
+def get_rec_hardware_channels_in_packet_order(configuration):
+    """
+    Gets the hardware channel (the "hwChan" of the SpikeChannel elements) of every neural column of a packet.
+    The columns are not in the order of the SpikeConfiguration, which groups the channels into nTrodes.
+        - Intan headstages sample all the chips together, so the columns go through channel 0 of every chip,
+          then channel 1 of every chip and so on. i.e. [0, 32, 64, 96, 1, 33, ...] for 4 chips with 32 channels per chip.
+          The chips come from the numChannels of the HardwareConfiguration, and the hardware channels
+          that are not in the SpikeConfiguration are skipped. i.e. hwChans {0, 1, 32, 33} of 2 chips are saved as [0, 32, 1, 33].
+        - Neuropixels probes are saved in increasing hardware channel order.
+    This is the same layout as the SpikeGadgets reader of python-neo, which spikeinterface uses.
+    Except that neo guesses increasing order when the number of saved channels is not a whole number of chips,
+    while the chips are always worked out from the hardware channels here.
+
+    Args:
+        configuration (xml.etree.ElementTree.Element): The root element from `read_rec_header`.
+
+    Returns:
+        list: The hardware channel of every column of the "channels" field.
+
+    Raises:
+        ValueError: If the SpikeConfiguration has more channels than the HardwareConfiguration, or an unknown device.
+            Or for Intan, if there is more than one chip and the hardware channels are not a whole number of chips,
+            or a hwChan of the SpikeConfiguration is repeated or is not one of the hardware channels.
+    """
+    num_channels = int(configuration.find("HardwareConfiguration").attrib["numChannels"])
+    spike_configuration = configuration.find("SpikeConfiguration")
+    if spike_configuration is None:
+        return []
+    hardware_channels = [int(spike_channel.attrib["hwChan"]) for ntrode in spike_configuration for spike_channel in ntrode.findall("SpikeChannel")]
+    if len(hardware_channels) > num_channels:
+        raise ValueError("The SpikeConfiguration has more channels than the HardwareConfiguration")
+    device = spike_configuration.attrib.get("device")
+    if device in ("neuropixels1", "neuropixels2"):
+        return sorted(hardware_channels)
+    if device not in (None, "intan"):
+        raise ValueError(f"Unknown SpikeConfiguration device: {device}")
+
+    channels_per_chip = int(spike_configuration.attrib.get("chanPerChip", 32))
+    # A headstage with fewer channels than a chip has a single chip
+    if channels_per_chip <= 0 or (num_channels > channels_per_chip and num_channels % channels_per_chip != 0):
+        # Guessing an order could map the nTrodes to the wrong columns
+        raise ValueError(f"The {num_channels} hardware channels are not a whole number of chips with {channels_per_chip} channels per chip")
+    # Only the channels in the SpikeConfiguration are saved
+    saved_hardware_channels = set(hardware_channels)
+    if len(saved_hardware_channels) != len(hardware_channels) or not saved_hardware_channels <= set(range(num_channels)):
+        raise ValueError(f"The hwChans of the SpikeConfiguration must be different hardware channels from 0 to {num_channels - 1}")
+    num_chips = max(num_channels // channels_per_chip, 1)
+    return [chip_channel + chip * channels_per_chip for chip_channel in range(channels_per_chip) for chip in range(num_chips)
+        if chip_channel + chip * channels_per_chip in saved_hardware_channels]
+
+def get_rec_packet_dtype(configuration):
+    """
+    Creates the structured data type of a packet from the hardware configuration.
+
+    Args:
+        configuration (xml.etree.ElementTree.Element): The root element from `read_rec_header`.
+
+    Returns:
+        np.dtype: With the fields "sync", one uint8 field per device with its bytes, "timestamp",
+            "sys_time" (if it is included) and "channels" with the int16 sample of every neural channel.
+    """
+    hardware_configuration = configuration.find("HardwareConfiguration")
+    num_channels = int(hardware_configuration.attrib["numChannels"])
+    # When only some of the channels are in the SpikeConfiguration, only those channels are saved
+    spike_configuration = configuration.find("SpikeConfiguration")
+    if spike_configuration is not None:
+        num_channels = min(num_channels, sum(len(ntrode.findall("SpikeChannel")) for ntrode in spike_configuration))
+
+    dtype_spec = [("sync", "u1")]
+    for device in hardware_configuration:
+        num_bytes = int(device.attrib.get("numBytes", 0))
+        if num_bytes > 0:
+            dtype_spec.append((device.attrib["name"], "u1", (num_bytes,)))
+    dtype_spec.append(("timestamp", "<u4"))
+    if hardware_configuration.attrib.get("sysTimeIncluded") == "1":
+        dtype_spec.append(("sys_time", "<i8"))
+    dtype_spec.append(("channels", "<i2", (num_channels,)))
+    return np.dtype(dtype_spec)
+
+class RecFile:
+    """
+    Memory mapped SpikeGadgets .rec file.
+
+    Args:
+        filename (str): The path to the .rec file.
+
+    Attributes:
+        configuration (xml.etree.ElementTree.Element): The root element of the XML configuration.
+        sampling_rate (float): The number of packets per second.
+        packets (np.memmap): Every complete packet in the file, with the data type from `get_rec_packet_dtype`.
+        hardware_channels (list): The hardware channel of every column of the "channels" field.
+            See `get_rec_hardware_channels_in_packet_order`.
+        ntrode_to_channel_indices (dict): The nTrode ID to the indices of its channels in the "channels" field.
+            The channels are in the same order as the SpikeChannel elements of the nTrode, and are found by their hardware channel.
+        channel_to_scaling (list): The factor to convert each column to microvolts, or None if it is not in the configuration.
+        digital_channels (dict): The ID of every digital input or output (i.e. "ECU_Din1") to its device, byte and bit.
+        analog_channels (dict): The ID of every analog channel (i.e. "ECU_Ain1") to its device and byte.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.configuration, self.header_size = read_rec_header(filename)
+        self.dtype = get_rec_packet_dtype(self.configuration)
+
+        hardware_configuration = self.configuration.find("HardwareConfiguration")
+        self.sampling_rate = float(hardware_configuration.attrib["samplingRate"])
+
+        # Only complete packets are mapped
+        num_packets = (os.path.getsize(filename) - self.header_size) // self.dtype.itemsize
+        if num_packets > 0:
+            self.packets = np.memmap(filename, dtype=self.dtype, mode="r", offset=self.header_size, shape=(num_packets,))
+        else:
+            self.packets = np.zeros([0], dtype=self.dtype)
+
+        # Which columns of the neural channels belong to each nTrode, found by the hardware channel of each column
+        self.hardware_channels = get_rec_hardware_channels_in_packet_order(self.configuration)
+        hardware_channel_to_index = {hardware_channel: index for index, hardware_channel in enumerate(self.hardware_channels)}
+        self.ntrode_to_channel_indices = {}
+        self.channel_to_scaling = [None] * len(self.hardware_channels)
+        spike_configuration = self.configuration.find("SpikeConfiguration")
+        if spike_configuration is not None:
+            for ntrode in spike_configuration:
+                scaling = ntrode.attrib.get("spikeScalingToUv")
+                for spike_channel in ntrode.findall("SpikeChannel"):
+                    channel_index = hardware_channel_to_index[int(spike_channel.attrib["hwChan"])]
+                    self.ntrode_to_channel_indices.setdefault(ntrode.attrib["id"], []).append(channel_index)
+                    self.channel_to_scaling[channel_index] = float(scaling) if scaling is not None else None
+
+        # Where each auxiliary channel is in the device bytes
+        self.digital_channels = {}
+        self.analog_channels = {}
+        for device in hardware_configuration:
+            if int(device.attrib.get("numBytes", 0)) <= 0:
+                continue
+            for channel in device.findall("Channel"):
+                location = {"device": device.attrib["name"], "start_byte": int(channel.attrib["startByte"]), "bit": int(channel.attrib.get("bit", 0))}
+                if channel.attrib.get("dataType") == "digital":
+                    self.digital_channels[channel.attrib["id"]] = location
+                elif channel.attrib.get("dataType") == "analog":
+                    self.analog_channels[channel.attrib["id"]] = location
+
+    def __len__(self):
+        return len(self.packets)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.filename!r}, packets={len(self)}, channels={self.dtype['channels'].shape[0]})"
+
+    @property
+    def timestamps(self):
+        """
+        numpy.ndarray: The timestamp of every packet, as a view into the file.
+        """
+        return self.packets["timestamp"]
+
+    def get_traces(self, channels=None):
+        """
+        Gets the neural traces as a view into the file.
+
+        Args:
+            channels (list or dict, optional): The channel indices to keep, or a dictionary of names to channel indices.
+                See `trodes.read_exported.select_trodes_channels`. Defaults to all the channels.
+
+        Returns:
+            numpy.ndarray or dict: A 2D array with the shape (packets, channels), or a dictionary of names to 1D traces.
+        """
+        traces = self.packets["channels"]
+        if channels is None:
+            return traces
+        return select_trodes_channels(traces, channels)
+
+    def get_ntrode_traces(self, ntrode_ids):
+        """
+        Gets the neural traces of the channels that belong to nTrodes.
+
+        Args:
+            ntrode_ids (list or dict): A list of nTrode IDs, or a dictionary of names (i.e. brain regions) to nTrode IDs.
+
+        Returns:
+            numpy.ndarray or dict: A 2D array with the shape (packets, channels) with the channels of all the nTrodes in order,
+                or a dictionary of names to a 2D array of the channels of that nTrode.
+        """
+        if isinstance(ntrode_ids, dict):
+            return {name: self.get_traces(self.ntrode_to_channel_indices[str(ntrode_id)]) for name, ntrode_id in ntrode_ids.items()}
+        channel_indices = [index for ntrode_id in ntrode_ids for index in self.ntrode_to_channel_indices[str(ntrode_id)]]
+        return self.get_traces(channel_indices)
+
+    def _get_device_bytes(self, location):
+        """
+        Gets a column of the bytes of a device as a view into the file.
+        """
+        return self.packets[location["device"]][:, location["start_byte"]]
+
+    def get_digital(self, channel_id):
+        """
+        Gets the state of a digital channel for every packet.
+
+        Args:
+            channel_id (str): The ID of the channel in the configuration, i.e. "ECU_Din1".
+
+        Returns:
+            numpy.ndarray: A boolean array of the state of the channel for every packet.
+        """
+        location = self.digital_channels[channel_id]
+        return ((self._get_device_bytes(location) >> location["bit"]) & 1).astype(bool)
+
+    def get_digital_changes(self, channel_id):
+        """
+        Gets the times that a digital channel changes, in the same format as the DIO files exported by Trodes.
+        The first packet is always included with the starting state.
+
+        Args:
+            channel_id (str): The ID of the channel in the configuration, i.e. "ECU_Din1".
+
+        Returns:
+            numpy.ndarray: Structured array with the "time" and "state" fields.
+        """
+        states = self.get_digital(channel_id)
+        change_indices = np.flatnonzero(np.diff(states)) + 1
+        if len(states):
+            change_indices = np.concatenate([[0], change_indices])
+        changes = np.zeros(len(change_indices), dtype=[("time", "<u4"), ("state", "u1")])
+        changes["time"] = self.timestamps[change_indices]
+        changes["state"] = states[change_indices]
+        return changes
+
+    def get_analog(self, channel_id):
+        """
+        Gets the values of an analog channel, which take up two bytes of a device, as a view into the file.
+
+        Args:
+            channel_id (str): The ID of the channel in the configuration, i.e. "ECU_Ain1".
+
+        Returns:
+            numpy.ndarray: An int16 array of the value of the channel for every packet.
+        """
+        location = self.analog_channels[channel_id]
+        device_bytes = self.packets[location["device"]][:, location["start_byte"]:location["start_byte"] + 2]
+        return device_bytes.view("<i2")[:, 0]
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Mapping between Trodes timestamps and sample indices.
+
+Trodes timestamps are not always continuous, because packets can be dropped and recordings can be paused.
+So the sample index of a timestamp can not be calculated with the sampling rate alone.
+`TimestampIndex` finds the gaps once and then maps between timestamps and sample indices with binary search.
+"""
+import numpy as np
+from trodes.read_exported import read_trodes_extracted_data_file
+
+class TimestampIndex:
+    """
+    Index of the timestamps of every sample in a Trodes recording.
+
+    Args:
+        timestamps (numpy.ndarray): The timestamp of every sample, in increasing order.
+        step (int, optional): The expected difference between consecutive timestamps.
+            Defaults to the most common difference, i.e. 1 for the raw timestamps and the decimation for LFP timestamps.
+        clockrate (int, optional): The number of timestamps per second. Needed for the conversions with seconds.
+
+    Raises:
+        ValueError: If there are no timestamps, or they are not strictly increasing.
+    """
+    def __init__(self, timestamps, step=None, clockrate=None):
+        timestamps = np.asarray(timestamps)
+        if timestamps.size == 0:
+            raise ValueError("Timestamps must have at least one sample")
+        # Trodes timestamps are read as a field with a shape of (1,)
+        self.timestamps = timestamps.reshape(len(timestamps), -1)[:, 0].astype(np.int64)
+        self.clockrate = clockrate
+
+        differences = np.diff(self.timestamps)
+        if np.any(differences <= 0):
+            raise ValueError("Timestamps must be strictly increasing")
+        if step is None:
+            # Counting only the differences that happen, so a long pause does not make an array as long as the pause
+            unique_differences, counts = np.unique(differences, return_counts=True)
+            step = unique_differences[counts.argmax()] if len(differences) else 1
+        self.step = int(step)
+
+        # Index of the first sample after every gap
+        self.gap_indices = np.flatnonzero(differences > self.step) + 1
+
+    @classmethod
+    def from_file(cls, filename, step=None):
+        """
+        Creates the index from a Trodes extracted timestamps file.
+        The clockrate is taken from the settings of the file.
+
+        Args:
+            filename (str): The path to the Trodes timestamps file.
+            step (int, optional): The expected difference between consecutive timestamps.
+
+        Returns:
+            TimestampIndex: The index of the timestamps in the file.
+        """
+        trodes_file = read_trodes_extracted_data_file(filename, mmap=True)
+        clockrate = int(trodes_file["clockrate"]) if "clockrate" in trodes_file else None
+        return cls(trodes_file["data"]["time"], step=step, clockrate=clockrate)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __repr__(self):
+        return f"{type(self).__name__}(samples={len(self)}, gaps={len(self.gap_indices)}, step={self.step})"
+
+    @property
+    def gaps(self):
+        """
+        numpy.ndarray: One row for every gap, with the columns:
+            - Index of the last sample before the gap
+            - Index of the first sample after the gap
+            - Timestamp of the last sample before the gap
+            - Timestamp of the first sample after the gap
+        """
+        return np.column_stack([self.gap_indices - 1, self.gap_indices,
+            self.timestamps[self.gap_indices - 1], self.timestamps[self.gap_indices]])
+
+    @property
+    def missing_samples(self):
+        """
+        int: The number of samples that would have been recorded during the gaps.
+        """
+        gap_lengths = self.timestamps[self.gap_indices] - self.timestamps[self.gap_indices - 1]
+        return int(np.sum(gap_lengths // self.step - 1))
+
+    def timestamp_to_index(self, timestamps, method="nearest"):
+        """
+        Gets the sample index for every timestamp.
+
+        Args:
+            timestamps (int or numpy.ndarray): The timestamps to look up.
+            method (str): How to handle timestamps that don't have a sample, i.e. in a gap.
+                - "nearest": The sample with the closest timestamp
+                - "before": The last sample at or before the timestamp, -1 if there is none
+                - "after": The first sample at or after the timestamp, the number of samples if there is none
+                - "exact": The sample with the same timestamp, -1 if there is none
+
+        Returns:
+            int or numpy.ndarray: The sample indices with the same shape as the timestamps.
+        """
+        queries = np.asarray(timestamps, dtype=np.int64)
+        if method == "after":
+            return np.searchsorted(self.timestamps, queries, side="left")
+        if method == "before":
+            return np.searchsorted(self.timestamps, queries, side="right") - 1
+
+        after_index = np.searchsorted(self.timestamps, queries, side="left")
+        if method == "exact":
+            clipped_index = np.minimum(after_index, len(self.timestamps) - 1)
+            return np.where(self.timestamps[clipped_index] == queries, clipped_index, -1)
+        if method == "nearest":
+            if len(self.timestamps) == 1:
+                return np.zeros_like(after_index)
+            after_index = np.clip(after_index, 1, len(self.timestamps) - 1)
+            before_index = after_index - 1
+            # Ties go to the earlier sample
+            is_after_closer = (self.timestamps[after_index] - queries) < (queries - self.timestamps[before_index])
+            return np.where(is_after_closer, after_index, before_index)
+        raise ValueError(f"Unknown method: {method}")
+
+    def index_to_timestamp(self, indices):
+        """
+        Gets the timestamp of every sample index.
+
+        Args:
+            indices (int or numpy.ndarray): The sample indices.
+
+        Returns:
+            int or numpy.ndarray: The timestamps with the same shape as the indices.
+        """
+        return self.timestamps[indices]
+
+    def seconds_to_index(self, seconds, method="nearest"):
+        """
+        Gets the sample index for times in seconds. The time is converted to timestamps with the clockrate.
+
+        Args:
+            seconds (float or numpy.ndarray): The times in seconds.
+            method (str): See `timestamp_to_index`.
+
+        Returns:
+            int or numpy.ndarray: The sample indices with the same shape as the times.
+        """
+        if self.clockrate is None:
+            raise ValueError("The clockrate is needed to convert seconds to timestamps")
+        return self.timestamp_to_index(np.rint(np.asarray(seconds) * self.clockrate), method=method)
+
+    def is_in_gap(self, timestamps):
+        """
+        Checks which timestamps fall inside of a gap, or outside of the recording, and so have no sample.
+
+        Args:
+            timestamps (int or numpy.ndarray): The timestamps to check.
+
+        Returns:
+            bool or numpy.ndarray: True for the timestamps without a sample within one step.
+        """
+        queries = np.asarray(timestamps, dtype=np.int64)
+        before_index = np.searchsorted(self.timestamps, queries, side="right") - 1
+        clipped_index = np.maximum(before_index, 0)
+        return (before_index < 0) | (queries - self.timestamps[clipped_index] >= self.step)
+
+def main():
+    """
+    Main function that runs when the script is run
+    """
+
+
+if __name__ == '__main__':
+    main()